@@ -0,0 +1,11 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def inline_background_jobs(settings):
+    """Run ``core.background`` jobs in the committing thread.
+
+    A pool thread would still be writing thumbnails into the temporary
+    ``MEDIA_ROOT`` of a test while the test removes it.
+    """
+    settings.BACKGROUND_WORKERS = 0
@@ -0,0 +1,270 @@
+"""Cache backend shared by all processes of one host.
+
+Entries live in a separate SQLite database in WAL mode, so readers never
+block the writer and every WSGI worker sees the same hits and
+invalidations without an external cache server::
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.backends.sqlite.SQLiteCache',
+            'LOCATION': '/var/cache/yatube/cache.sqlite3',
+            'OPTIONS': {
+                'MAX_ENTRIES': 10000,
+                'MAX_SIZE': 64 * 1024 * 1024,
+            },
+        },
+    }
+
+When ``MAX_ENTRIES`` entries or ``MAX_SIZE`` bytes are exceeded, expired
+entries are removed first and then the least recently used
+``1 / CULL_FREQUENCY`` of the rest. The number and size of entries are
+kept up to date by triggers in a one-row ``totals`` table, so writes
+check the limits without scanning the cache.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY,'
+    ' value BLOB NOT NULL,'
+    ' expires REAL,'
+    ' accessed REAL NOT NULL,'
+    ' size INTEGER NOT NULL'
+    ') WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+    'CREATE TABLE IF NOT EXISTS totals ('
+    ' id INTEGER PRIMARY KEY CHECK (id = 1),'
+    ' entries INTEGER NOT NULL,'
+    ' size INTEGER NOT NULL'
+    ')',
+    'CREATE TRIGGER IF NOT EXISTS cache_insert AFTER INSERT ON cache BEGIN'
+    ' UPDATE totals SET entries = entries + 1, size = size + NEW.size;'
+    ' END',
+    'CREATE TRIGGER IF NOT EXISTS cache_delete AFTER DELETE ON cache BEGIN'
+    ' UPDATE totals SET entries = entries - 1, size = size - OLD.size;'
+    ' END',
+    'CREATE TRIGGER IF NOT EXISTS cache_update AFTER UPDATE OF size'
+    ' ON cache BEGIN'
+    ' UPDATE totals SET size = size + NEW.size - OLD.size;'
+    ' END',
+    # Counts a cache file created before the triggers, once.
+    'INSERT OR IGNORE INTO totals (id, entries, size)'
+    ' SELECT 1, COUNT(*), COALESCE(SUM(size), 0) FROM cache',
+)
+# SQLite limits the number of host parameters in one statement.
+MAX_PARAMS = 500
+# Hits refresh the LRU timestamp at most this often, in seconds, so hot
+# keys do not turn every read into a write.
+ACCESS_RESOLUTION = 1.0
+
+
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self._max_size = params.get('OPTIONS', {}).get('MAX_SIZE')
+        self._local = threading.local()
+
+    def _connection(self):
+        """Connection of the current thread, reopened after a fork."""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self._path, timeout=30, isolation_level=None,
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            # Rows dropped by INSERT OR REPLACE fire the delete trigger.
+            connection.execute('PRAGMA recursive_triggers=ON')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+            with self._write():
+                for statement in SCHEMA:
+                    connection.execute(statement)
+        return connection
+
+    @contextmanager
+    def _write(self):
+        """Transaction that holds the write lock from the start."""
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _dumps(self, value):
+        return pickle.dumps(value, self.pickle_protocol)
+
+    def get(self, key, default=None, version=None):
+        return self.get_many([key], version).get(key, default)
+
+    def get_many(self, keys, version=None):
+        key_map = {self._key(key, version): key for key in keys}
+        now = time.time()
+        rows = []
+        found = list(key_map)
+        for start in range(0, len(found), MAX_PARAMS):
+            chunk = found[start:start + MAX_PARAMS]
+            rows += self._connection().execute(
+                'SELECT key, value, accessed FROM cache WHERE key IN ({})'
+                ' AND (expires IS NULL OR expires > ?)'.format(
+                    ', '.join('?' * len(chunk))),
+                (*chunk, now),
+            ).fetchall()
+        hits = [
+            key for key, _, accessed in rows
+            if accessed < now - ACCESS_RESOLUTION
+        ]
+        if hits:
+            with self._write() as connection:
+                for start in range(0, len(hits), MAX_PARAMS):
+                    chunk = hits[start:start + MAX_PARAMS]
+                    connection.execute(
+                        'UPDATE cache SET accessed = ? WHERE key IN ({})'
+                        .format(', '.join('?' * len(chunk))),
+                        (now, *chunk),
+                    )
+        return {
+            key_map[key]: pickle.loads(value) for key, value, _ in rows
+        }
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        now = time.time()
+        rows = [
+            (self._key(key, version), self._dumps(value), expires, now)
+            for key, value in data.items()
+        ]
+        with self._write() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO cache'
+                ' (key, value, expires, accessed, size)'
+                ' VALUES (?, ?, ?, ?, length(?2))',
+                rows,
+            )
+            self._cull(connection, now)
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._write() as connection:
+            connection.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (key, now),
+            )
+            added = connection.execute(
+                'INSERT OR IGNORE INTO cache'
+                ' (key, value, expires, accessed, size)'
+                ' VALUES (?, ?, ?, ?, length(?2))',
+                (key, self._dumps(value), self.get_backend_timeout(timeout),
+                 now),
+            ).rowcount == 1
+            if added:
+                self._cull(connection, now)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        now = time.time()
+        with self._write() as connection:
+            return connection.execute(
+                'UPDATE cache SET expires = ?, accessed = ?'
+                ' WHERE key = ? AND (expires IS NULL OR expires > ?)',
+                (self.get_backend_timeout(timeout), now, key, now),
+            ).rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        """Atomically add ``delta`` to a stored number."""
+        key = self._key(key, version)
+        now = time.time()
+        with self._write() as connection:
+            row = connection.execute(
+                'SELECT value FROM cache WHERE key = ?'
+                ' AND (expires IS NULL OR expires > ?)',
+                (key, now),
+            ).fetchone()
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            connection.execute(
+                'UPDATE cache SET value = ?, accessed = ?,'
+                ' size = length(?1) WHERE key = ?',
+                (self._dumps(value), now, key),
+            )
+        return value
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version)
+
+    def delete_many(self, keys, version=None):
+        keys = [self._key(key, version) for key in keys]
+        with self._write() as connection:
+            connection.executemany(
+                'DELETE FROM cache WHERE key = ?',
+                ((key,) for key in keys),
+            )
+
+    def has_key(self, key, version=None):
+        return self._connection().execute(
+            'SELECT 1 FROM cache WHERE key = ?'
+            ' AND (expires IS NULL OR expires > ?)',
+            (self._key(key, version), time.time()),
+        ).fetchone() is not None
+
+    def clear(self):
+        with self._write() as connection:
+            connection.execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Connections are kept open between requests on purpose.
+        pass
+
+    def _totals(self, connection):
+        return connection.execute(
+            'SELECT entries, size FROM totals',
+        ).fetchone()
+
+    def _cull(self, connection, now):
+        if not self._over_limits(*self._totals(connection)):
+            return
+        connection.execute('DELETE FROM cache WHERE expires <= ?', (now,))
+        entries, size = self._totals(connection)
+        if not self._over_limits(entries, size):
+            return
+        if self._cull_frequency == 0:
+            connection.execute('DELETE FROM cache')
+            return
+        connection.execute(
+            'DELETE FROM cache WHERE key IN ('
+            ' SELECT key FROM cache ORDER BY accessed LIMIT ?)',
+            (max(entries // self._cull_frequency, 1),),
+        )
+
+    def _over_limits(self, entries, size):
+        return entries > self._max_entries or (
+            self._max_size is not None and size > self._max_size
+        )
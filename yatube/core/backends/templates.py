@@ -0,0 +1,45 @@
+"""Django template backend that reports rendering time.
+
+The time of each outermost render, with everything it includes or
+renders inside, is added to the ``template_seconds`` figure of the
+request tracked by ``core.metrics``.
+
+    TEMPLATES = [{
+        'BACKEND': 'core.backends.templates.DjangoTemplates',
+        ...
+    }]
+"""
+import threading
+import time
+
+from django.template import TemplateDoesNotExist
+from django.template.backends import django
+
+from core import metrics
+
+_local = threading.local()
+
+
+class Template(django.Template):
+    def render(self, context=None, request=None):
+        depth = getattr(_local, 'depth', 0)
+        _local.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            _local.depth = depth
+            if not depth:
+                metrics.add_to_request(
+                    'template_seconds', time.perf_counter() - start)
+
+
+class DjangoTemplates(django.DjangoTemplates):
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            django.reraise(exc, self)
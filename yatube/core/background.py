@@ -0,0 +1,63 @@
+"""Work done off the request path once the transaction commits.
+
+``after_commit`` hands a job to a process-wide pool of
+``BACKGROUND_WORKERS`` threads when the current transaction commits,
+and does nothing if it rolls back. With no workers the job runs in the
+committing thread, which keeps tests and the development server
+deterministic.
+"""
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_executor = None
+
+
+def _executor_instance():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.BACKGROUND_WORKERS,
+                thread_name_prefix='background',
+            )
+        return _executor
+
+
+def _complete(future, function, args):
+    if not future.set_running_or_notify_cancel():
+        return
+    try:
+        future.set_result(function(*args))
+    except Exception as error:
+        logger.exception('Background job %s failed', function.__name__)
+        future.set_exception(error)
+
+
+def _run(future, function, args):
+    try:
+        _complete(future, function, args)
+    finally:
+        connections.close_all()
+
+
+def after_commit(function, *args):
+    """Run ``function(*args)`` in the pool after the commit.
+
+    Return a ``Future`` of its result; it never completes if the
+    transaction rolls back.
+    """
+    future = Future()
+    if not settings.BACKGROUND_WORKERS:
+        transaction.on_commit(lambda: _complete(future, function, args))
+    else:
+        transaction.on_commit(
+            lambda: _executor_instance().submit(_run, future, function, args)
+        )
+    return future
@@ -0,0 +1,149 @@
+"""Helpers for page and fragment caches."""
+import hashlib
+import math
+import random
+import re
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+
+from core import metrics
+
+LOCK_PREFIX = 'lock:'
+LOCK_POLL_INTERVAL = 0.05
+PER_USER_PLACEHOLDER = '<!--per-user:{}-->'
+PER_USER_RE = re.compile(r'<!--per-user:([\w/.-]+)-->')
+
+
+def _is_due(envelope, now):
+    """Whether to recompute: expired, or refreshed early by XFetch."""
+    _, expires, delta = envelope
+    beta = settings.CACHE_EARLY_REFRESH_BETA
+    return now - delta * beta * math.log(1 - random.random()) >= expires
+
+
+def _wait_for(keys):
+    """Values the lock holders store for ``keys`` within the wait time."""
+    deadline = time.time() + settings.CACHE_LOCK_WAIT
+    found = {}
+    while len(found) < len(keys) and time.time() < deadline:
+        time.sleep(LOCK_POLL_INTERVAL)
+        envelopes = cache.get_many([key for key in keys if key not in found])
+        found.update(
+            (key, envelope[0]) for key, envelope in envelopes.items()
+        )
+    return found
+
+
+def get_many_or_set(keys, render, timeout, name='default'):
+    """Cached values of ``keys`` in the same order.
+
+    Values are stored as ``(value, expires, delta)`` envelopes that are
+    kept ``CACHE_STALE_TIMEOUT`` seconds past their expiry. Missing and
+    expired keys are passed at once to ``render`` by the single request
+    that takes their lock keys; it returns a ``{key: value}`` dict stored
+    with one ``set_many`` (``None`` values are not stored). Meanwhile the
+    other requests serve the stale value, or wait up to
+    ``CACHE_LOCK_WAIT`` seconds for the fresh one. A key is also
+    refreshed early with a probability that grows as its expiry nears and
+    with ``delta``, the time its rendering took (XFetch).
+    """
+    now = time.time()
+    envelopes = cache.get_many(keys)
+    values = {key: envelope[0] for key, envelope in envelopes.items()}
+    due = [
+        key for key in keys
+        if key not in envelopes or _is_due(envelopes[key], now)
+    ]
+    locked = [
+        key for key in due
+        if cache.add(LOCK_PREFIX + key, 1, settings.CACHE_LOCK_TIMEOUT)
+    ]
+    waiting = [key for key in due if key not in locked + list(values)]
+    if waiting:
+        values.update(_wait_for(waiting))
+    mine = locked + [key for key in waiting if key not in values]
+    metrics.incr(
+        metrics.labelled('cache_hits_total', cache=name),
+        len(keys) - len(due),
+    )
+    metrics.incr(
+        metrics.labelled('cache_misses_total', cache=name), len(mine))
+    metrics.add_to_request('cache_hits', len(keys) - len(due))
+    metrics.add_to_request('cache_misses', len(mine))
+    metrics.incr(
+        metrics.labelled('cache_coalesced_total', cache=name),
+        len(due) - len(mine),
+    )
+    metrics.incr(
+        metrics.labelled('cache_early_refreshes_total', cache=name),
+        sum(1 for key in locked if envelopes.get(key, (0, 0))[1] > now),
+    )
+    if mine:
+        start = time.perf_counter()
+        try:
+            rendered = render(mine)
+            delta = (time.perf_counter() - start) / len(mine)
+            expires = time.time() + timeout
+            cache.set_many(
+                {
+                    key: (value, expires, delta)
+                    for key, value in rendered.items() if value is not None
+                },
+                timeout + settings.CACHE_STALE_TIMEOUT,
+            )
+        finally:
+            if locked:
+                cache.delete_many([LOCK_PREFIX + key for key in locked])
+        values.update(rendered)
+    return [values.get(key) for key in keys]
+
+
+def fill_per_user(content, request):
+    """Render the ``{% per_user %}`` placeholders of a shared page."""
+    return PER_USER_RE.sub(
+        lambda match: render_to_string(match.group(1), request=request),
+        content,
+    )
+
+
+def cache_page_shared(timeout, key_prefix):
+    """Cache a page once for all users, unlike ``vary_on_cookie``.
+
+    Parts of the page included with ``{% per_user %}`` are kept in the
+    cached copy as placeholders and rendered for every request. The page
+    is stored through ``get_many_or_set``, so only one request renders it
+    when it expires.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            key = 'shared_page:{}:{}'.format(
+                key_prefix,
+                hashlib.md5(request.get_full_path().encode()).hexdigest(),
+            )
+            response = None
+
+            def render(keys):
+                nonlocal response
+                request.shared_cache = True
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return {key: None}
+                return {key: response.content.decode(response.charset)}
+
+            content, = get_many_or_set([key], render, timeout, key_prefix)
+            if content is None:
+                return response
+            if response is None:
+                response = HttpResponse()
+            response.content = fill_per_user(content, request)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,82 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Runs in a fresh interpreter: loads yatube.wsgi and serves one request.
+PROBE = '''
+import io, json, sys, time
+start = time.perf_counter()
+from yatube.wsgi import application
+loaded = time.perf_counter()
+environ = {
+    'REQUEST_METHOD': 'GET', 'PATH_INFO': sys.argv[1], 'QUERY_STRING': '',
+    'SERVER_NAME': 'localhost', 'SERVER_PORT': '80',
+    'HTTP_HOST': 'localhost', 'SERVER_PROTOCOL': 'HTTP/1.1',
+    'wsgi.version': (1, 0), 'wsgi.url_scheme': 'http',
+    'wsgi.input': io.BytesIO(), 'wsgi.errors': sys.stderr,
+    'wsgi.multithread': False, 'wsgi.multiprocess': True,
+    'wsgi.run_once': False,
+}
+statuses = []
+body = b''.join(application(
+    environ, lambda status, headers, *args: statuses.append(status)))
+served = time.perf_counter()
+print(json.dumps({
+    'status': statuses[0], 'load': loaded - start, 'first': served - loaded,
+}))
+'''
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure start-up and time to the first request of fresh WSGI '
+        'processes with and without warm-up.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default='/',
+            help='Path of the first request.',
+        )
+        parser.add_argument(
+            '--runs',
+            type=int,
+            default=5,
+            help='Processes started per mode; medians are reported.',
+        )
+
+    def probe(self, path, warm_up):
+        environment = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': os.environ.get(
+                'DJANGO_SETTINGS_MODULE', 'yatube.settings'),
+            'YATUBE_WARMUP': '1' if warm_up else '0',
+        }
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE, path],
+            cwd=settings.BASE_DIR,
+            env=environment,
+            stdout=subprocess.PIPE,
+            check=True,
+        ).stdout
+        return json.loads(output.splitlines()[-1])
+
+    def handle(self, *args, path, runs, **options):
+        for warm_up in (False, True):
+            results = [self.probe(path, warm_up) for _ in range(runs)]
+            load, first = (
+                statistics.median(result[key] for result in results) * 1000
+                for key in ('load', 'first')
+            )
+            self.stdout.write(
+                f'{"With" if warm_up else "Without"} warm-up: '
+                f'start-up {load:.0f} ms, first request {first:.0f} ms, '
+                f'in total {load + first:.0f} ms '
+                f'({results[-1]["status"]}).'
+            )
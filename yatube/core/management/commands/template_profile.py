@@ -0,0 +1,76 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from core import metrics
+
+COLUMNS = {
+    'renders': 'template_renders_total',
+    'cumulative': 'template_seconds_total',
+    'self': 'template_self_seconds_total',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        'Print the render time of templates and includes collected with '
+        'TEMPLATE_PROFILING.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sort',
+            choices=list(COLUMNS),
+            default='self',
+            help='Column to sort templates by.',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=20,
+            help='Rows per table.',
+        )
+
+    def handle(self, *args, sort, limit, **options):
+        values, _ = metrics.collect()
+        templates = defaultdict(lambda: dict.fromkeys(COLUMNS, 0))
+        includes = defaultdict(lambda: [0, 0.0])
+        for name, value in values.items():
+            family, found = metrics.parse(name)
+            for column, metric in COLUMNS.items():
+                if family == metric:
+                    templates[found['template']][column] = value
+            if family == 'template_includes_total':
+                includes[found['parent'], found['template']][0] = value
+            elif family == 'template_include_seconds_total':
+                includes[found['parent'], found['template']][1] = value
+        if not templates:
+            self.stdout.write(
+                'No template renders recorded; set TEMPLATE_PROFILING and '
+                'METRICS_DIR to profile the server.'
+            )
+            return
+        self.stdout.write(
+            f'{"template":<50} {"renders":>8} {"total ms":>10} '
+            f'{"self ms":>10} {"avg ms":>8}'
+        )
+        rows = sorted(
+            templates.items(), key=lambda row: row[1][sort], reverse=True)
+        for template, row in rows[:limit]:
+            self.stdout.write(
+                f'{template:<50} {row["renders"]:>8.0f} '
+                f'{row["cumulative"] * 1000:>10.1f} '
+                f'{row["self"] * 1000:>10.1f} '
+                f'{row["cumulative"] * 1000 / max(row["renders"], 1):>8.2f}'
+            )
+        if includes:
+            self.stdout.write('')
+            self.stdout.write(
+                f'{"include":<72} {"renders":>8} {"total ms":>10}')
+            rows = sorted(
+                includes.items(), key=lambda row: row[1][1], reverse=True)
+            for (parent, template), (count, seconds) in rows[:limit]:
+                self.stdout.write(
+                    f'{parent + " > " + template:<72} {count:>8.0f} '
+                    f'{seconds * 1000:>10.1f}'
+                )
@@ -0,0 +1,155 @@
+"""Serving of uploaded media files.
+
+Files are answered with validators for conditional GETs and with byte
+ranges. Content-addressed names never change their content and are
+cached by clients for a year. With ``MEDIA_SENDFILE`` set the response
+only names the file for the front server (``X-Sendfile`` for Apache
+and lighttpd, ``X-Accel-Redirect`` for nginx); otherwise the file
+object is handed to the WSGI server's ``wsgi.file_wrapper``.
+"""
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (
+    FileResponse, Http404, HttpResponse, StreamingHttpResponse,
+)
+from django.urls import re_path
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+from core.storage import content_addressed_storage
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def media_path(path):
+    """Absolute path of a file under ``MEDIA_ROOT``, or ``Http404``."""
+    path = posixpath.normpath(path).lstrip('/')
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Файл не найден.')
+    if not os.path.isfile(fullpath):
+        raise Http404('Файл не найден.')
+    return path, fullpath
+
+
+def etag(path, stat):
+    if content_addressed_storage.is_addressed(path):
+        digest = os.path.splitext(posixpath.basename(path))[0]
+        return quote_etag(digest)
+    return quote_etag(f'{stat.st_size:x}-{stat.st_mtime_ns:x}')
+
+
+def byte_range(request, size, tag, last_modified):
+    """``(start, end)`` of a satisfiable single ``Range``.
+
+    None means the whole file is sent, ``False`` that the range cannot
+    be satisfied. Several ranges are answered with the whole file, which
+    RFC 7233 allows.
+    """
+    match = RANGE_RE.match(request.META.get('HTTP_RANGE', ''))
+    if match is None:
+        return None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if if_range and if_range != tag:
+        if parse_http_date_safe(if_range) != last_modified:
+            return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def read_range(file, start, length):
+    with file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                return
+            length -= len(chunk)
+            yield chunk
+
+
+def serve(request, path):
+    """The media file at ``path`` relative to ``MEDIA_ROOT``."""
+    path, fullpath = media_path(path)
+    stat = os.stat(fullpath)
+    last_modified = int(stat.st_mtime)
+    tag = etag(path, stat)
+    response = get_conditional_response(
+        request, etag=tag, last_modified=last_modified)
+    if response is None:
+        content_type, encoding = mimetypes.guess_type(fullpath)
+        content_type = content_type or 'application/octet-stream'
+        sendfile = settings.MEDIA_SENDFILE
+        span = None if sendfile else byte_range(
+            request, stat.st_size, tag, last_modified)
+        if sendfile == 'x-accel-redirect':
+            response = HttpResponse(content_type=content_type)
+            response['X-Accel-Redirect'] = (
+                settings.MEDIA_ACCEL_REDIRECT_PREFIX + path)
+        elif sendfile == 'x-sendfile':
+            response = HttpResponse(content_type=content_type)
+            response['X-Sendfile'] = fullpath
+        elif span is False:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+        elif span:
+            start, end = span
+            length = end - start + 1
+            response = StreamingHttpResponse(
+                read_range(open(fullpath, 'rb'), start, length),
+                status=206,
+                content_type=content_type,
+            )
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            response['Content-Length'] = length
+        else:
+            response = FileResponse(
+                open(fullpath, 'rb'), content_type=content_type)
+        if encoding:
+            response['Content-Encoding'] = encoding
+        response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = tag
+    response['Last-Modified'] = http_date(last_modified)
+    if content_addressed_storage.is_addressed(path):
+        response['Cache-Control'] = IMMUTABLE
+    else:
+        response['Cache-Control'] = (
+            f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}')
+    return response
+
+
+def media_urlpatterns():
+    """Route ``serve`` under the path of ``MEDIA_URL``.
+
+    An absolute ``MEDIA_URL`` names a host of its own, which serves the
+    files, so no route is added for it.
+    """
+    url = urlparse(settings.MEDIA_URL)
+    if url.netloc:
+        return []
+    return [
+        re_path(
+            r'^{}(?P<path>.*)$'.format(re.escape(url.path.lstrip('/'))),
+            serve,
+            name='media',
+        ),
+    ]
@@ -0,0 +1,361 @@
+"""Counters, gauges and histograms exposed by ``core.views.metrics``.
+
+Labels are part of the name, as in ``cache_hits_total{cache="post_cards"}``;
+``labelled`` builds such names. Values live in the process; with
+``METRICS_DIR`` set each process also writes them to its own file there
+at most every ``METRICS_FLUSH_INTERVAL`` seconds and ``render`` adds up
+the files of all processes, as Prometheus expects one answer per host.
+Files of stopped processes are folded into ``totals.json`` by the next
+scrape, so counters never go down while the number of files stays that
+of the running processes; gauges of stopped processes are dropped.
+
+Histograms keep cumulative bucket counts, so they merge across processes
+exactly; ``render`` also estimates ``QUANTILES`` of the merged buckets.
+
+Requests collect their own SQL, template and cache figures with
+``add_to_request`` while ``core.middleware.MetricsMiddleware`` tracks
+them.
+"""
+import fcntl
+import glob
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+SIZE_BUCKETS = tuple(1024 * 4 ** power for power in range(8))
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+QUANTILES = (0.5, 0.95, 0.99)
+NAME_RE = re.compile(r'^(?P<base>[^{]+)(\{(?P<labels>.*)\})?$')
+LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+TOTALS = 'totals.json'
+
+_lock = threading.Lock()
+_values = defaultdict(float)
+_gauges = set()
+_histograms = {}
+_local = threading.local()
+_process = None
+_flushed = 0.0
+
+
+def _pairs(labels):
+    return ','.join(
+        '{}="{}"'.format(
+            key,
+            str(value).replace('\\', r'\\').replace('"', r'\"'),
+        )
+        for key, value in sorted(labels.items())
+    )
+
+
+def _split(name):
+    match = NAME_RE.match(name)
+    return match.group('base'), match.group('labels') or ''
+
+
+def _join(base, labels, **extra):
+    pairs = ','.join(part for part in (labels, _pairs(extra)) if part)
+    return f'{base}{{{pairs}}}' if pairs else base
+
+
+def labelled(name, **labels):
+    """``name`` with Prometheus ``labels``."""
+    return _join(name, '', **labels)
+
+
+def parse(name):
+    """``(family, labels)`` of a name made by ``labelled``."""
+    base, pairs = _split(name)
+    return base, {
+        key: re.sub(r'\\(.)', r'\1', value)
+        for key, value in LABEL_RE.findall(pairs)
+    }
+
+
+def incr(name, value=1):
+    with _lock:
+        _values[name] += value
+
+
+def set_value(name, value):
+    with _lock:
+        _values[name] = value
+        _gauges.add(name)
+
+
+def observe(name, value, buckets=DURATION_BUCKETS):
+    """Count ``value`` in the histogram ``name``."""
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = _histograms[name] = {
+                'buckets': list(buckets),
+                'counts': [0] * len(buckets),
+                'sum': 0.0,
+                'count': 0,
+            }
+        for index, bound in enumerate(histogram['buckets']):
+            if value <= bound:
+                histogram['counts'][index] += 1
+        histogram['sum'] += value
+        histogram['count'] += 1
+
+
+@contextmanager
+def timer(name):
+    """Add the time spent in the block, in seconds, to ``name``."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        incr(name, time.perf_counter() - start)
+
+
+@contextmanager
+def track_request():
+    """Collect ``add_to_request`` figures of the block in a dict."""
+    figures = defaultdict(float)
+    _local.request = figures
+    try:
+        yield figures
+    finally:
+        _local.request = None
+
+
+def add_to_request(name, value):
+    """Add to a figure of the tracked request of this thread, if any."""
+    figures = getattr(_local, 'request', None)
+    if figures is not None:
+        figures[name] += value
+
+
+def snapshot():
+    """Counters and gauges of this process."""
+    with _lock:
+        return dict(_values)
+
+
+def _state():
+    with _lock:
+        return {
+            'values': dict(_values),
+            'gauges': sorted(_gauges),
+            'histograms': {
+                name: {**histogram, 'counts': list(histogram['counts'])}
+                for name, histogram in _histograms.items()
+            },
+        }
+
+
+def _reset():
+    global _process, _flushed
+    with _lock:
+        _values.clear()
+        _gauges.clear()
+        _histograms.clear()
+    _process = None
+    _flushed = 0.0
+
+
+if hasattr(os, 'register_at_fork'):
+    # Forked workers start from zero instead of counting the parent's
+    # figures twice.
+    os.register_at_fork(after_in_child=_reset)
+
+
+def _read(path):
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def _write(path, state):
+    with open(path + '.tmp', 'w') as file:
+        json.dump(state, file)
+    os.replace(path + '.tmp', path)
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+@contextmanager
+def _locked(directory, operation):
+    """Hold the lock of ``directory``; readers share it, ``prune`` not."""
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, '.lock'), 'a') as lock:
+        fcntl.flock(lock, operation)
+        yield
+
+
+def _stopped(directory):
+    """Files of processes that are not running any more."""
+    for path in glob.glob(os.path.join(directory, '*-*.json')):
+        pid = os.path.basename(path).split('-', 1)[0]
+        if pid.isdigit() and not _is_alive(int(pid)):
+            yield path
+
+
+def prune():
+    """Fold the files of stopped processes into ``TOTALS``.
+
+    Return the number of folded files.
+    """
+    directory = settings.METRICS_DIR
+    if not directory:
+        return 0
+    with _locked(directory, fcntl.LOCK_EX):
+        stopped = list(_stopped(directory))
+        if not stopped:
+            return 0
+        path = os.path.join(directory, TOTALS)
+        states = [
+            state for state in map(_read, [path, *stopped]) if state
+        ]
+        values, histograms = _merge(
+            {**state, 'values': {
+                name: value for name, value in state['values'].items()
+                if name not in state['gauges']
+            }}
+            for state in states
+        )
+        _write(path, {
+            'values': values, 'gauges': [], 'histograms': histograms,
+        })
+        for stopped_path in stopped:
+            os.remove(stopped_path)
+    return len(stopped)
+
+
+def flush(force=False):
+    """Write the values of this process to ``METRICS_DIR``."""
+    global _process, _flushed
+    directory = settings.METRICS_DIR
+    now = time.monotonic()
+    if not directory or (
+        not force and now - _flushed < settings.METRICS_FLUSH_INTERVAL
+    ):
+        return
+    _flushed = now
+    if _process is None:
+        _process = f'{os.getpid()}-{uuid.uuid4().hex}'
+    os.makedirs(directory, exist_ok=True)
+    _write(os.path.join(directory, f'{_process}.json'), _state())
+
+
+def _states():
+    directory = settings.METRICS_DIR
+    if not directory:
+        return [_state()]
+    flush(force=True)
+    prune()
+    with _locked(directory, fcntl.LOCK_SH):
+        paths = sorted(
+            glob.glob(os.path.join(directory, '*.json')),
+            key=os.path.getmtime,
+        )
+        return [state for state in map(_read, paths) if state]
+
+
+def _merge(states):
+    values = defaultdict(float)
+    histograms = {}
+    for state in states:
+        gauges = set(state['gauges'])
+        for name, value in state['values'].items():
+            if name in gauges:
+                values[name] = value
+            else:
+                values[name] += value
+        for name, histogram in state['histograms'].items():
+            merged = histograms.get(name)
+            if merged is None or merged['buckets'] != histogram['buckets']:
+                histograms[name] = {
+                    **histogram, 'counts': list(histogram['counts'])}
+                continue
+            merged['counts'] = [
+                a + b for a, b in zip(merged['counts'], histogram['counts'])
+            ]
+            merged['sum'] += histogram['sum']
+            merged['count'] += histogram['count']
+    return dict(values), histograms
+
+
+def collect():
+    """``(values, histograms)`` of all processes.
+
+    Counters and histograms are summed; for gauges the most recently
+    written value wins.
+    """
+    return _merge(_states())
+
+
+def quantile(q, buckets, counts, count):
+    """Estimate of the ``q`` quantile from cumulative bucket counts.
+
+    Interpolates linearly inside the bucket, like PromQL's
+    ``histogram_quantile``; past the last bucket its bound is returned.
+    """
+    if not count:
+        return float('nan')
+    rank = q * count
+    lower, below = 0.0, 0
+    for bound, cumulative in zip(buckets, counts):
+        if cumulative >= rank:
+            if cumulative == below:
+                return bound
+            return lower + (bound - lower) * (rank - below) / (
+                cumulative - below)
+        lower, below = bound, cumulative
+    return buckets[-1]
+
+
+def render():
+    """Metrics in the Prometheus text exposition format."""
+    values, histograms = collect()
+    lines = [f'{name} {value:g}\n' for name, value in sorted(values.items())]
+    typed = set()
+    estimates = []
+    for name, histogram in sorted(histograms.items()):
+        base, labels = _split(name)
+        if base not in typed:
+            typed.add(base)
+            lines.append(f'# TYPE {base} histogram\n')
+        bounds = [f'{bound:g}' for bound in histogram['buckets']] + ['+Inf']
+        counts = histogram['counts'] + [histogram['count']]
+        lines.extend(
+            f'{_join(base + "_bucket", labels, le=bound)} {count}\n'
+            for bound, count in zip(bounds, counts)
+        )
+        lines.append(
+            f'{_join(base + "_sum", labels)} {histogram["sum"]:g}\n')
+        lines.append(
+            f'{_join(base + "_count", labels)} {histogram["count"]}\n')
+        for q in QUANTILES:
+            estimate = quantile(
+                q, histogram['buckets'], histogram['counts'],
+                histogram['count'],
+            )
+            estimates.append(
+                f'{_join(base + "_quantile", labels, quantile=q)} '
+                f'{estimate:g}\n'
+            )
+    return ''.join(lines + estimates)
@@ -0,0 +1,125 @@
+"""Request instrumentation.
+
+``MetricsMiddleware`` records latency, response size, SQL and template
+time and cache hits of every request in ``core.metrics`` histograms and
+counters labelled by URL name.
+
+``QueryBudgetMiddleware`` counts the queries of every request and the
+time spent in them with ``connection.execute_wrapper``. Requests of a
+URL name listed in ``QUERY_BUDGETS`` that run more queries are logged,
+or fail with ``QueryBudgetExceeded`` when ``QUERY_BUDGET_RAISE`` is set,
+so a template that starts querying per row is caught by the tests.
+Queries per request and requests over budget are recorded in
+``core.metrics`` by URL name.
+"""
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+UNRESOLVED = '<unresolved>'
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryCounter:
+    """``execute_wrapper`` that counts queries and their time."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - start
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else UNRESOLVED
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(
+                    connections[alias].execute_wrapper(counter))
+            response = self.get_response(request)
+        view = view_name(request)
+        budget = settings.QUERY_BUDGETS.get(view)
+        metrics.observe(
+            metrics.labelled('http_sql_queries_per_request', view=view),
+            counter.count,
+            metrics.COUNT_BUCKETS,
+        )
+        metrics.add_to_request('sql_queries', counter.count)
+        metrics.add_to_request('sql_seconds', counter.seconds)
+        if budget is not None and counter.count > budget:
+            metrics.incr(metrics.labelled(
+                'http_query_budget_exceeded_total', view=view))
+            message = (
+                f'{view} ran {counter.count} SQL queries '
+                f'with a budget of {budget}: {request.path}'
+            )
+            if settings.QUERY_BUDGET_RAISE:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+
+def response_size(response):
+    if response.streaming:
+        return int(response.get('Content-Length', 0))
+    return len(response.content)
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with metrics.track_request() as figures:
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+        view = view_name(request)
+        metrics.incr(metrics.labelled(
+            'http_requests_total', view=view, status=response.status_code))
+        metrics.observe(
+            metrics.labelled('http_request_duration_seconds', view=view),
+            elapsed,
+        )
+        metrics.observe(
+            metrics.labelled('http_response_size_bytes', view=view),
+            response_size(response),
+            metrics.SIZE_BUCKETS,
+        )
+        for figure in ('sql', 'template'):
+            metrics.observe(
+                metrics.labelled(f'http_{figure}_duration_seconds', view=view),
+                figures[f'{figure}_seconds'],
+            )
+        for figure in ('sql_queries', 'cache_hits', 'cache_misses'):
+            metrics.incr(
+                metrics.labelled(f'http_{figure}_total', view=view),
+                figures[figure],
+            )
+        metrics.flush()
+        return response
@@ -12,3 +12,27 @@ class CreatedTextModel(models.Model):
 
     class Meta:
         abstract = True
+
+
+class StoredFile(models.Model):
+    """Reference count of a file in ``ContentAddressedStorage``."""
+
+    name = models.CharField(
+        verbose_name='Имя файла',
+        max_length=255,
+        unique=True,
+    )
+    size = models.BigIntegerField(
+        verbose_name='Размер',
+    )
+    refs = models.PositiveIntegerField(
+        verbose_name='Ссылок',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Файл'
+        verbose_name_plural = 'Файлы'
+
+    def __str__(self):
+        return f'{self.name} ({self.refs})'
@@ -0,0 +1,75 @@
+"""Render time of every template and include.
+
+With ``TEMPLATE_PROFILING`` set, ``install`` wraps
+``django.template.base.Template._render``, which runs for each template,
+``{% include %}`` and nested ``render_to_string`` alike. Per template
+name it adds to ``core.metrics`` counters:
+
+* ``template_renders_total`` - renders;
+* ``template_seconds_total`` - cumulative time, includes counted in;
+* ``template_self_seconds_total`` - time without the nested templates;
+* ``template_include_seconds_total`` and ``template_includes_total``
+  labelled with the including ``parent`` as well.
+
+``manage.py template_profile`` prints them as a table.
+"""
+import threading
+import time
+
+from django.template.base import Template
+
+from core import metrics
+
+STRING_TEMPLATE = '<string>'
+
+_local = threading.local()
+_original_render = None
+
+
+def _profiled_render(self, context):
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    name = self.origin.template_name or self.name or STRING_TEMPLATE
+    frame = [name, 0.0]
+    stack.append(frame)
+    start = time.perf_counter()
+    try:
+        return _original_render(self, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        stack.pop()
+        metrics.incr(metrics.labelled('template_renders_total', template=name))
+        metrics.incr(
+            metrics.labelled('template_seconds_total', template=name),
+            elapsed,
+        )
+        metrics.incr(
+            metrics.labelled('template_self_seconds_total', template=name),
+            elapsed - frame[1],
+        )
+        if stack:
+            parent = stack[-1]
+            parent[1] += elapsed
+            labels = {'parent': parent[0], 'template': name}
+            metrics.incr(
+                metrics.labelled('template_includes_total', **labels))
+            metrics.incr(
+                metrics.labelled('template_include_seconds_total', **labels),
+                elapsed,
+            )
+
+
+def install():
+    """Start profiling template renders; repeated calls do nothing."""
+    global _original_render
+    if _original_render is None:
+        _original_render = Template._render
+        Template._render = _profiled_render
+
+
+def uninstall():
+    global _original_render
+    if _original_render is not None:
+        Template._render = _original_render
+        _original_render = None
@@ -0,0 +1,103 @@
+"""Content-addressed, deduplicated file storage."""
+import hashlib
+import os
+import re
+
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+from core.models import StoredFile
+
+SHARD_LEVELS = 2
+SHARD_WIDTH = 2
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """File system storage that names files by the SHA-256 of content.
+
+    ``posts/photo.jpg`` is saved as ``posts/ab/cd/abcd....jpg``: identical
+    uploads share one file, and the nested hash-prefix directories keep
+    every directory small. Each save adds a reference to the file in
+    ``StoredFile`` and each delete removes one; the file itself is
+    deleted with its last reference.
+    """
+
+    addressed_re = re.compile(
+        r'(^|/)' + r'[0-9a-f]{%d}/' % SHARD_WIDTH * SHARD_LEVELS
+        + r'[0-9a-f]{64}(\.\w+)?$'
+    )
+
+    def addressed_name(self, name, digest):
+        directory, basename = os.path.split(name)
+        shards = [
+            digest[level * SHARD_WIDTH:(level + 1) * SHARD_WIDTH]
+            for level in range(SHARD_LEVELS)
+        ]
+        extension = os.path.splitext(basename)[1].lower()
+        return '/'.join(
+            part for part in (directory, *shards, digest + extension) if part
+        )
+
+    def is_addressed(self, name):
+        return bool(self.addressed_re.search(name))
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        name = self.addressed_name(name, digest.hexdigest())
+        # The locked row keeps a concurrent delete of the last reference
+        # from unlinking the file between the check and the new reference.
+        with transaction.atomic():
+            stored, _ = StoredFile.objects.select_for_update().get_or_create(
+                name=name, defaults={'size': content.size},
+            )
+            StoredFile.objects.filter(pk=stored.pk).update(
+                refs=F('refs') + 1)
+            if not self.exists(name):
+                # Identical content may be written concurrently: the
+                # upload goes to a unique name first and is renamed
+                # atomically.
+                upload = super()._save(name + '.upload', content)
+                os.replace(self.path(upload), self.path(name))
+            else:
+                # A fresh mtime keeps posts.garbage off a file that is
+                # getting a new reference.
+                os.utime(self.path(name))
+        return name
+
+    def delete(self, name):
+        with transaction.atomic():
+            stored = StoredFile.objects.select_for_update().filter(
+                name=name,
+            ).first()
+            if stored is not None and stored.refs > 1:
+                StoredFile.objects.filter(pk=stored.pk).update(
+                    refs=F('refs') - 1)
+                return
+            if stored is not None:
+                stored.delete()
+            super().delete(name)
+
+
+def release_on_commit(file):
+    """Drop the reference of a stored ``file`` once the transaction commits.
+
+    Names outside the storage location, as left by old data, are ignored.
+    """
+    name, storage = file.name, file.storage
+
+    def release():
+        try:
+            storage.delete(name)
+        except SuspiciousFileOperation:
+            pass
+
+    transaction.on_commit(release)
+
+
+content_addressed_storage = ContentAddressedStorage()
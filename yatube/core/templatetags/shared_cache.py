@@ -0,0 +1,20 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from core.caching import PER_USER_PLACEHOLDER
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def per_user(context, template_name):
+    """Include a template that depends on the current user.
+
+    Pages cached with ``cache_page_shared`` get a placeholder instead,
+    which is filled in for every request.
+    """
+    request = context.get('request')
+    if getattr(request, 'shared_cache', False):
+        return mark_safe(PER_USER_PLACEHOLDER.format(template_name))
+    return context.template.engine.get_template(template_name).render(
+        context)
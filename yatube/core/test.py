@@ -1,6 +1,35 @@
+import glob
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
 from http import HTTPStatus
+from io import StringIO
+from unittest import mock
 
-from django.test import TestCase
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.template import engines
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from core import metrics, profiling
+from core.backends.sqlite import SQLiteCache
+from core.caching import LOCK_PREFIX, get_many_or_set
+from core.media import media_urlpatterns
+from core.middleware import QueryBudgetExceeded
+from core.models import StoredFile
+from core.storage import ContentAddressedStorage, content_addressed_storage
+from core.throttling import Throttle
+from core.warmup import compile_templates, warm_up
+from posts.models import Post
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp()
 
 
 class ViewTestClass(TestCase):
@@ -8,3 +37,566 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+    def test_metrics_page(self):
+        """Метрики доступны только персоналу в текстовом формате."""
+        metrics.set_value('test_metric', 3)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        staff = get_user_model().objects.create(
+            username='staff', is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertIn('test_metric 3\n', response.content.decode())
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        """Сборщик метрик входит по токену."""
+        response = self.client.get(
+            reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        response = self.client.get(
+            reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+
+
+def _record_metrics(directory):
+    with override_settings(METRICS_DIR=directory):
+        metrics.incr('shared_total', 2)
+        metrics.set_value('shared_gauge', 1)
+        metrics.observe('shared_seconds', 0.2)
+        metrics.flush(force=True)
+
+
+class MetricsTests(TestCase):
+    def tearDown(self):
+        cache.clear()
+
+    def test_request_histograms_by_view(self):
+        """Запросы попадают в гистограммы с именем URL."""
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:index'))
+        values, histograms = metrics.collect()
+        name = 'http_request_duration_seconds{view="posts:index"}'
+        self.assertGreaterEqual(histograms[name]['count'], 2)
+        template = histograms[
+            'http_template_duration_seconds{view="posts:index"}']
+        self.assertGreater(template['sum'], 0)
+        self.assertGreater(
+            values['http_cache_hits_total{view="posts:index"}'], 0)
+        self.assertGreater(
+            values['http_sql_queries_total{view="posts:index"}'], 0)
+        text = metrics.render()
+        self.assertIn(
+            '# TYPE http_request_duration_seconds histogram\n', text)
+        self.assertIn(
+            'http_request_duration_seconds_bucket'
+            '{view="posts:index",le="+Inf"} ',
+            text,
+        )
+        self.assertIn(
+            'http_response_size_bytes_quantile'
+            '{view="posts:index",quantile="0.99"} ',
+            text,
+        )
+
+    def test_quantile_interpolated(self):
+        """Квантили оцениваются по корзинам гистограммы."""
+        buckets, counts = [1, 2, 4], [10, 90, 100]
+        self.assertAlmostEqual(
+            metrics.quantile(0.5, buckets, counts, 100), 1.5)
+        self.assertAlmostEqual(
+            metrics.quantile(0.05, buckets, counts, 100), 0.5)
+        self.assertEqual(metrics.quantile(0.99, buckets, [0, 0, 0], 100), 4)
+
+    def test_processes_added_up(self):
+        """Метрики разных процессов складываются."""
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        context = multiprocessing.get_context('fork')
+        for _ in range(2):
+            process = context.Process(
+                target=_record_metrics, args=(directory,))
+            process.start()
+            process.join()
+        with override_settings(METRICS_DIR=directory):
+            values, histograms = metrics.collect()
+        self.assertEqual(values['shared_total'], 4)
+        self.assertEqual(histograms['shared_seconds']['count'], 2)
+        self.assertEqual(histograms['shared_seconds']['counts'][5], 2)
+
+    def test_stopped_processes_folded(self):
+        """Файлы остановленных процессов сливаются в один, счетчики
+        не уменьшаются, а их показатели пропадают.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        context = multiprocessing.get_context('fork')
+        for _ in range(2):
+            process = context.Process(
+                target=_record_metrics, args=(directory,))
+            process.start()
+            process.join()
+            with override_settings(METRICS_DIR=directory):
+                values, histograms = metrics.collect()
+        self.assertEqual(values['shared_total'], 4)
+        self.assertEqual(histograms['shared_seconds']['count'], 2)
+        self.assertNotIn('shared_gauge', values)
+        files = sorted(glob.glob(os.path.join(directory, '*.json')))
+        self.assertEqual(len(files), 2)
+        self.assertIn(os.path.join(directory, metrics.TOTALS), files)
+
+
+def _increment(location, times):
+    cache = SQLiteCache(location, {})
+    for _ in range(times):
+        cache.incr('counter')
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = os.path.join(self.directory, 'cache.sqlite3')
+        self.cache = SQLiteCache(self.location, {})
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def make_cache(self, **options):
+        return SQLiteCache(self.location, {'OPTIONS': options})
+
+    def test_shared_between_instances(self):
+        """Записи и удаления видны другим экземплярам кэша."""
+        other = self.make_cache()
+        self.cache.set_many({'a': 1, 'b': [2]})
+        self.assertEqual(other.get_many(['a', 'b', 'c']), {'a': 1, 'b': [2]})
+        other.delete('a')
+        self.assertIsNone(self.cache.get('a'))
+        self.assertTrue(self.cache.has_key('b'))
+
+    def test_expiry_and_add(self):
+        """Просроченные записи не возвращаются и не мешают add."""
+        self.cache.set('key', 'old', timeout=-1)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.add('key', 'new'))
+        self.assertFalse(self.cache.add('key', 'newer'))
+        self.assertEqual(self.cache.get('key'), 'new')
+
+    def test_incr_is_atomic_across_processes(self):
+        """incr из нескольких процессов не теряет обновлений."""
+        self.cache.set('counter', 0, timeout=None)
+        processes = [
+            multiprocessing.Process(
+                target=_increment, args=(self.location, 50))
+            for _ in range(4)
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_least_recently_used_evicted(self):
+        """При превышении MAX_ENTRIES удаляются давно не читанные записи."""
+        cache = self.make_cache(MAX_ENTRIES=4, CULL_FREQUENCY=2)
+        for key in 'abcd':
+            cache.set(key, key)
+            time.sleep(0.01)
+        with mock.patch('core.backends.sqlite.ACCESS_RESOLUTION', 0):
+            cache.get('a')
+        cache.set('e', 'e')
+        self.assertEqual(
+            sorted(cache.get_many(list('abcde'))), ['a', 'd', 'e'])
+
+    def test_size_limit_evicts(self):
+        """При превышении MAX_SIZE кэш освобождает место."""
+        cache = self.make_cache(MAX_SIZE=3000, CULL_FREQUENCY=2)
+        for key in 'abcd':
+            cache.set(key, 'x' * 1000)
+            time.sleep(0.01)
+        self.assertLess(len(cache.get_many(list('abcd'))), 4)
+        self.assertIn('d', cache.get_many(list('abcd')))
+
+    def test_totals_follow_writes(self):
+        """Число и размер записей ведутся без пересчета таблицы."""
+        cache = self.make_cache()
+        cache.set_many({'a': 'x' * 100, 'b': 'y', 'c': 1})
+        cache.set('a', 'short')
+        cache.add('d', 'd')
+        cache.incr('c', 1000)
+        cache.delete('b')
+        connection = cache._connection()
+        self.assertEqual(
+            cache._totals(connection),
+            connection.execute(
+                'SELECT COUNT(*), SUM(size) FROM cache').fetchone(),
+        )
+        cache.clear()
+        self.assertEqual(cache._totals(connection), (0, 0))
+
+
+class QueryBudgetTests(TestCase):
+    def tearDown(self):
+        cache.clear()
+
+    def exceeded(self):
+        return metrics.snapshot().get(metrics.labelled(
+            'http_query_budget_exceeded_total', view='posts:index'), 0)
+
+    def test_queries_by_url_name(self):
+        """Число запросов к базе копится в метриках по имени URL."""
+        name = metrics.labelled(
+            'http_sql_queries_per_request', view='posts:index')
+        before = metrics.collect()[1].get(name, {'count': 0, 'sum': 0})
+        exceeded = self.exceeded()
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:index'))
+        histogram = metrics.collect()[1][name]
+        self.assertEqual(histogram['count'], before['count'] + 2)
+        self.assertGreater(histogram['sum'], before['sum'])
+        self.assertEqual(self.exceeded(), exceeded)
+        self.assertIn(
+            'http_sql_queries_per_request_bucket{view="posts:index",le="5"}',
+            metrics.render(),
+        )
+
+    @override_settings(
+        QUERY_BUDGETS={'posts:index': 0}, QUERY_BUDGET_RAISE=True)
+    def test_budget_exceeded_raises(self):
+        """Превышение бюджета в тестах — ошибка."""
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'posts:index'):
+            self.client.get(reverse('posts:index'))
+
+    @override_settings(
+        QUERY_BUDGETS={'posts:index': 0}, QUERY_BUDGET_RAISE=False)
+    def test_budget_exceeded_logged(self):
+        """В продакшене превышение бюджета пишется в лог."""
+        exceeded = self.exceeded()
+        with self.assertLogs('core.middleware', 'WARNING') as logs:
+            response = self.client.get(reverse('posts:index'))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertIn('with a budget of 0', logs.output[0])
+        self.assertEqual(self.exceeded(), exceeded + 1)
+
+
+class TemplateProfilingTests(TestCase):
+    def setUp(self):
+        profiling.install()
+        self.addCleanup(profiling.uninstall)
+        self.author = get_user_model().objects.create(username='author')
+        for i in range(3):
+            Post.objects.create(text=f'Пост {i}', author=self.author)
+
+    def tearDown(self):
+        cache.clear()
+
+    def delta(self, before, name, **labels):
+        name = metrics.labelled(name, **labels)
+        return metrics.snapshot().get(name, 0) - before.get(name, 0)
+
+    def test_templates_and_includes_timed(self):
+        """Время шаблонов и включений копится по именам.
+
+        Блоки наследника рендерятся внутри base.html, он и включает
+        карточки.
+        """
+        before = metrics.snapshot()
+        self.client.get(reverse('posts:profile', args=('author',)))
+        card = 'posts/includes/post.html'
+        self.assertEqual(
+            self.delta(before, 'template_renders_total', template=card), 3)
+        self.assertEqual(self.delta(
+            before, 'template_includes_total',
+            parent='base.html', template=card,
+        ), 3)
+        self.assertEqual(self.delta(
+            before, 'template_includes_total',
+            parent=card, template='posts/includes/post_image.html',
+        ), 3)
+        page = 'posts/profile.html'
+        cumulative = self.delta(
+            before, 'template_seconds_total', template=page)
+        own = self.delta(before, 'template_self_seconds_total', template=page)
+        self.assertGreater(own, 0)
+        self.assertLess(own, cumulative)
+
+    def test_report(self):
+        """Команда выводит таблицы шаблонов и включений."""
+        self.client.get(reverse('posts:profile', args=('author',)))
+        out = StringIO()
+        call_command('template_profile', sort='renders', stdout=out)
+        report = out.getvalue()
+        self.assertIn('posts/includes/post.html', report)
+        self.assertIn(
+            'base.html > posts/includes/post.html', report)
+
+
+LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
+
+def with_loaders(loaders):
+    """``TEMPLATES`` of the project with other ``loaders``."""
+    template = settings.TEMPLATES[0]
+    return [{
+        **template,
+        'APP_DIRS': False,
+        'OPTIONS': {**template['OPTIONS'], 'loaders': loaders},
+    }]
+
+
+class WarmUpTests(SimpleTestCase):
+    def test_steps_reported(self):
+        """Прогрев импортирует приложения и разбирает URL."""
+        report = warm_up()
+        self.assertEqual(set(report), {'apps', 'urls', 'templates'})
+        self.assertGreater(report['apps'][0], 0)
+        self.assertGreater(report['urls'][0], 0)
+        self.assertIn(
+            metrics.labelled('warmup_seconds', step='urls'),
+            metrics.snapshot(),
+        )
+
+    def test_templates_compiled_with_cached_loader(self):
+        """С кэширующим загрузчиком шаблоны компилируются заранее."""
+        with self.settings(TEMPLATES=with_loaders([
+            ('django.template.loaders.cached.Loader', LOADERS),
+        ])):
+            compiled = compile_templates()
+            loader = engines.all()[0].engine.template_loaders[0]
+            self.assertEqual(compiled, len(loader.get_template_cache))
+            self.assertIn('posts/index.html', loader.get_template_cache)
+
+    def test_templates_skipped_without_cached_loader(self):
+        """Без кэширующего загрузчика компилировать незачем."""
+        with self.settings(TEMPLATES=with_loaders(LOADERS)):
+            self.assertEqual(compile_templates(), 0)
+
+
+class ThrottleTests(SimpleTestCase):
+    @mock.patch('core.throttling.time')
+    def test_consume_sleeps_to_rate(self, clock):
+        """Ограничитель спит, пока не наберется допустимая скорость."""
+        clock.monotonic.side_effect = [100.0, 100.5, 103.0]
+        throttle = Throttle(10)
+        throttle.consume(10)
+        clock.sleep.assert_called_once_with(1.0)
+        throttle.consume(5)
+        clock.sleep.assert_called_with(1.0)
+        throttle.consume(10)
+        self.assertEqual(clock.sleep.call_count, 2)
+
+    @mock.patch('core.throttling.time')
+    def test_no_rate_no_sleep(self, clock):
+        """Без ограничения ограничитель не спит."""
+        Throttle(0).consume(10 ** 9)
+        clock.sleep.assert_not_called()
+
+
+class StampedeTests(SimpleTestCase):
+    def setUp(self):
+        self.rendered = []
+
+    def tearDown(self):
+        cache.clear()
+
+    def render(self, keys):
+        self.rendered.extend(keys)
+        time.sleep(0.2)
+        return {key: f'value {len(self.rendered)}' for key in keys}
+
+    def counter(self, name):
+        return metrics.snapshot().get(
+            metrics.labelled(name, cache='stampede'), 0)
+
+    def test_concurrent_misses_render_once(self):
+        """Одновременные промахи по ключу вычисляют значение один раз."""
+        coalesced = self.counter('cache_coalesced_total')
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(
+                get_many_or_set(['key'], self.render, 60, 'stampede')))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.rendered, ['key'])
+        self.assertEqual(results, [['value 1']] * 5)
+        self.assertEqual(self.counter('cache_coalesced_total'), coalesced + 4)
+
+    def test_stale_value_served_while_refreshing(self):
+        """Пока значение пересчитывается, отдается устаревшее."""
+        get_many_or_set(['key'], self.render, 0, 'stampede')
+        cache.add(LOCK_PREFIX + 'key', 1)
+        self.assertEqual(
+            get_many_or_set(['key'], self.render, 60, 'stampede'),
+            ['value 1'],
+        )
+        self.assertEqual(self.rendered, ['key'])
+        cache.delete(LOCK_PREFIX + 'key')
+        self.assertEqual(
+            get_many_or_set(['key'], self.render, 60, 'stampede'),
+            ['value 2'],
+        )
+
+    def test_early_refresh(self):
+        """Значение может быть пересчитано до истечения срока."""
+        get_many_or_set(['key'], self.render, 2, 'stampede')
+        early = self.counter('cache_early_refreshes_total')
+        with mock.patch('core.caching.random.random', return_value=1 - 1e-9):
+            self.assertEqual(
+                get_many_or_set(['key'], self.render, 2, 'stampede'),
+                ['value 2'],
+            )
+        self.assertEqual(
+            self.counter('cache_early_refreshes_total'), early + 1)
+
+
+class ContentAddressedStorageTests(TestCase):
+    def setUp(self):
+        self.location = tempfile.mkdtemp()
+        self.storage = ContentAddressedStorage(location=self.location)
+
+    def tearDown(self):
+        shutil.rmtree(self.location, ignore_errors=True)
+
+    def test_files_named_by_content(self):
+        """Файлы называются по хешу содержимого в подкаталогах."""
+        name = self.storage.save('posts/photo.JPG', ContentFile(b'photo'))
+        self.assertRegex(
+            name, r'^posts/([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}\.jpg$')
+        self.assertTrue(self.storage.is_addressed(name))
+        self.assertFalse(self.storage.is_addressed('posts/photo.jpg'))
+        other = self.storage.save('posts/photo.jpg', ContentFile(b'other'))
+        self.assertNotEqual(name, other)
+
+    def test_identical_files_shared(self):
+        """Одинаковые файлы хранятся один раз и удаляются
+        с последней ссылкой.
+        """
+        names = [
+            self.storage.save(f'posts/{i}.gif', ContentFile(b'gif'))
+            for i in range(3)
+        ]
+        self.assertEqual(len(set(names)), 1)
+        name = names[0]
+        self.assertEqual(StoredFile.objects.get(name=name).refs, 3)
+        self.assertEqual(
+            sum(len(files) for _, _, files in os.walk(self.location)), 1)
+        for _ in range(2):
+            self.storage.delete(name)
+            self.assertTrue(self.storage.exists(name))
+        self.storage.delete(name)
+        self.assertFalse(self.storage.exists(name))
+        self.assertFalse(StoredFile.objects.filter(name=name).exists())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MediaServeTests(TestCase):
+    content = b'0123456789'
+    url = '/media/posts/a.txt'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        os.makedirs(os.path.join(TEMP_MEDIA_ROOT, 'posts'))
+        with open(os.path.join(TEMP_MEDIA_ROOT, 'posts', 'a.txt'), 'wb') as f:
+            f.write(cls.content)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_full_response(self):
+        """Файл отдается целиком с валидаторами кэша."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertEqual(b''.join(response.streaming_content), self.content)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('max-age=86400', response['Cache-Control'])
+        self.assertTrue(response['ETag'])
+        self.assertTrue(response['Last-Modified'])
+
+    def test_conditional_get(self):
+        """Неизменившийся файл отвечает 304."""
+        response = self.client.get(self.url)
+        for headers in (
+            {'HTTP_IF_NONE_MATCH': response['ETag']},
+            {'HTTP_IF_MODIFIED_SINCE': response['Last-Modified']},
+        ):
+            with self.subTest(headers=headers):
+                self.assertEqual(
+                    self.client.get(self.url, **headers).status_code,
+                    HTTPStatus.NOT_MODIFIED,
+                )
+
+    def test_byte_ranges(self):
+        """Диапазоны байт отдаются со статусом 206."""
+        cases = (
+            ('bytes=2-5', b'2345', 'bytes 2-5/10'),
+            ('bytes=7-', b'789', 'bytes 7-9/10'),
+            ('bytes=-3', b'789', 'bytes 7-9/10'),
+            ('bytes=8-100', b'89', 'bytes 8-9/10'),
+        )
+        for header, body, content_range in cases:
+            with self.subTest(header=header):
+                response = self.client.get(self.url, HTTP_RANGE=header)
+                self.assertEqual(
+                    response.status_code, HTTPStatus.PARTIAL_CONTENT)
+                self.assertEqual(b''.join(response.streaming_content), body)
+                self.assertEqual(response['Content-Range'], content_range)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-')
+        self.assertEqual(
+            response.status_code, HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+        response = self.client.get(
+            self.url, HTTP_RANGE='bytes=2-5', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+
+    def test_addressed_files_immutable(self):
+        """Файлы с именем по хешу кэшируются навсегда."""
+        name = content_addressed_storage.save(
+            'posts/b.txt', ContentFile(self.content))
+        response = self.client.get(f'/media/{name}')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn(os.path.splitext(name)[0][-64:], response['ETag'])
+
+    def test_sendfile_handoff(self):
+        """Файл передается фронтенд-серверу без чтения в Python."""
+        with self.settings(MEDIA_SENDFILE='x-accel-redirect'):
+            response = self.client.get(self.url)
+        self.assertEqual(
+            response['X-Accel-Redirect'], '/protected-media/posts/a.txt')
+        self.assertEqual(response.content, b'')
+        with self.settings(MEDIA_SENDFILE='x-sendfile'):
+            response = self.client.get(self.url)
+        self.assertEqual(
+            response['X-Sendfile'],
+            os.path.join(TEMP_MEDIA_ROOT, 'posts', 'a.txt'),
+        )
+
+    def test_media_url_route(self):
+        """Маршрут берет путь из MEDIA_URL и не добавляется
+        для адреса на другом хосте.
+        """
+        with self.settings(MEDIA_URL='http://testserver/files/'):
+            self.assertEqual(media_urlpatterns(), [])
+        with self.settings(MEDIA_URL='/files/'):
+            pattern, = media_urlpatterns()
+        match = pattern.resolve('files/posts/a.txt')
+        self.assertEqual(match.kwargs, {'path': 'posts/a.txt'})
+
+    def test_outside_media_root(self):
+        """Файлы вне MEDIA_ROOT недоступны."""
+        for url in ('/media/../manage.py', '/media/posts/missing.txt'):
+            with self.subTest(url=url):
+                self.assertEqual(
+                    self.client.get(url).status_code, HTTPStatus.NOT_FOUND)
@@ -0,0 +1,30 @@
+"""Rate limiting of batch jobs.
+
+``Throttle`` spreads work over time so that a maintenance command does
+not starve the site of disk or database bandwidth.
+"""
+import time
+
+
+class Throttle:
+    """Blocks so that at most ``rate`` units are consumed per second.
+
+    A falsy ``rate`` disables the limit.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.start = None
+        self.consumed = 0
+
+    def consume(self, amount):
+        """Account ``amount`` units, sleeping until they are allowed."""
+        if not self.rate:
+            return
+        now = time.monotonic()
+        if self.start is None:
+            self.start = now
+        self.consumed += amount
+        delay = self.start + self.consumed / self.rate - now
+        if delay > 0:
+            time.sleep(delay)
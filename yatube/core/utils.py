@@ -1,8 +1,242 @@
+import base64
+import binascii
+import hashlib
+import heapq
+import time
+
 from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
 from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+CURSOR_KEYS = ('created', 'pk')
+COUNT_VERSION_KEY = 'paginator:count_version'
+
+
+def count_version():
+    """Current version of the counts cached by ``cached_count``.
+
+    A version lost to cache eviction is seeded from the clock rather
+    than a constant, so counts cached under an earlier version do not
+    come back.
+    """
+    cache.add(COUNT_VERSION_KEY, int(time.time()), None)
+    return cache.get(COUNT_VERSION_KEY)
+
+
+def bump_count_version():
+    """Invalidate every count cached by ``cached_count``."""
+    try:
+        cache.incr(COUNT_VERSION_KEY)
+    except ValueError:
+        cache.add(COUNT_VERSION_KEY, int(time.time()), None)
+
+
+def cached_count(queryset, refresh=False):
+    """``(count, exact)`` of ``queryset`` from a versioned cache entry.
+
+    Past ``PAGINATOR_EXACT_COUNT_LIMIT`` rows only the first rows are
+    counted and the result is flagged as approximate, so a cache miss
+    never scans the whole table. ``refresh`` recounts and replaces the
+    cached entry.
+    """
+    try:
+        sql = str(queryset.query)
+    except EmptyResultSet:
+        return 0, True
+    version = count_version()
+    key = 'paginator:count:{}:{}'.format(
+        version, hashlib.md5(sql.encode()).hexdigest(),
+    )
+    result = None if refresh else cache.get(key)
+    if result is None:
+        limit = settings.PAGINATOR_EXACT_COUNT_LIMIT
+        count = queryset.order_by()[:limit + 1].count()
+        result = (min(count, limit), count <= limit)
+        cache.set(key, result, settings.PAGINATOR_COUNT_TIMEOUT)
+    return result
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator whose ``count`` comes from ``cached_count``."""
+
+    @cached_property
+    def count_info(self):
+        return cached_count(self.object_list)
+
+    @property
+    def count(self):
+        return self.count_info[0]
+
+    @property
+    def count_is_exact(self):
+        return self.count_info[1]
+
+
+class CursorPaginator(CachedCountPaginator):
+    """Keyset paginator over a ``(datetime, integer)`` pair of keys.
+
+    Pages are selected with ``WHERE (created, pk) < cursor LIMIT n + 1``
+    instead of ``COUNT(*)`` plus ``OFFSET``, so a deep page costs the same
+    as the first one. Links carry opaque ``after``/``before`` cursors;
+    ``?page=N`` is still served for old links.
+    """
+
+    def __init__(self, object_list, per_page, keys=CURSOR_KEYS):
+        super().__init__(object_list, per_page)
+        self.keys = keys
+        self._num_pages = 1
+
+    @property
+    def num_pages(self):
+        """Number of pages known so far: the current one and the next."""
+        return self._num_pages
+
+    @property
+    def total_pages(self):
+        """Number of pages by the cached, possibly approximate, count."""
+        return max((self.count - 1) // self.per_page + 1, 1)
+
+    def get_page(self, number=None, after=None, before=None):
+        position = self.decode_cursor(before)
+        if position is not None:
+            return self._page_before(*position)
+        position = self.decode_cursor(after)
+        if position is not None:
+            return self._page_after(*position)
+        return self._page_number(number)
+
+    def encode_cursor(self, row, number):
+        created, pk = self.position(row)
+        raw = f'{created.isoformat()}|{pk}|{number}'.encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        if not cursor:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            created, pk, number = raw.decode().split('|')
+            created = parse_datetime(created)
+            if created is None:
+                return None
+            return created, int(pk), int(number)
+        except (ValueError, binascii.Error, UnicodeDecodeError):
+            return None
+
+    def position(self, row):
+        return tuple(getattr(row, key) for key in self.keys)
+
+    def fetch(self, position=None, descending=True, offset=0):
+        """Return up to ``per_page + 1`` rows past ``position``."""
+        queryset = self.past(self.object_list, position, descending)
+        return list(queryset[offset:offset + self.per_page + 1])
+
+    def past(self, queryset, position, descending=True):
+        """Order ``queryset`` by the keys and skip rows up to ``position``."""
+        prefix, lookup = ('-', 'lt') if descending else ('', 'gt')
+        queryset = queryset.order_by(*(prefix + key for key in self.keys))
+        if position is None:
+            return queryset
+        created, pk = position
+        created_key, pk_key = self.keys
+        return queryset.filter(
+            Q(**{f'{created_key}__{lookup}': created})
+            | Q(**{f'{pk_key}__{lookup}': pk}),
+            **{f'{created_key}__{lookup}e': created},
+        )
+
+    def _page_after(self, created, pk, number):
+        rows = self.fetch((created, pk))
+        has_next = len(rows) > self.per_page
+        return self._build_page(rows, number, True, has_next)
+
+    def _page_before(self, created, pk, number):
+        rows = self.fetch((created, pk), descending=False)
+        if not rows:
+            return self._page_number(1)
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        return self._build_page(rows, number, has_previous, True)
+
+    def _page_number(self, number):
+        try:
+            number = max(int(number), 1)
+        except (TypeError, ValueError):
+            number = 1
+        rows = self.fetch(offset=(number - 1) * self.per_page)
+        if not rows and number > 1:
+            # Past the end: the cached count may be stale, so recount once
+            # and serve the last page by the fresh count.
+            self.count_info = cached_count(self.object_list, refresh=True)
+            number = self.total_pages
+            rows = self.fetch(offset=(number - 1) * self.per_page)
+        return self._build_page(
+            rows, number, number > 1, len(rows) > self.per_page
+        )
+
+    def _build_page(self, rows, number, has_previous, has_next):
+        rows = rows[:self.per_page]
+        number = max(number, 2) if has_previous else 1
+        self._num_pages = number + 1 if has_next else number
+        page = self._get_page(rows, number, self)
+        page.previous_cursor = (
+            self.encode_cursor(rows[0], number - 1)
+            if has_previous and rows else None
+        )
+        page.next_cursor = (
+            self.encode_cursor(rows[-1], number + 1) if has_next else None
+        )
+        return page
+
+
+class MergedCursorPaginator(CursorPaginator):
+    """Cursor paginator over several querysets sharing the same keys.
+
+    Every source is read past the cursor with its own indexed range query
+    and the results are k-way merged; rows seen in more than one source
+    are shown once.
+    """
+
+    def __init__(self, sources, per_page, keys=CURSOR_KEYS):
+        super().__init__(sources[0], per_page, keys)
+        self.sources = sources
+
+    @cached_property
+    def count_info(self):
+        counts = [cached_count(source) for source in self.sources]
+        return (
+            sum(count for count, _ in counts),
+            all(exact for _, exact in counts),
+        )
+
+    def fetch(self, position=None, descending=True, offset=0):
+        limit = offset + self.per_page + 1
+        streams = [
+            list(self.past(source, position, descending)[:limit])
+            for source in self.sources
+        ]
+        rows = []
+        seen = set()
+        for row in heapq.merge(
+            *streams, key=self.position, reverse=descending
+        ):
+            if self.position(row) not in seen:
+                seen.add(self.position(row))
+                rows.append(row)
+        return rows[offset:limit]
 
 
-def get_page_obj(request, _list):
-    paginator = Paginator(_list, settings.POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+def get_page_obj(request, _list, keys=CURSOR_KEYS):
+    paginator_class = (
+        MergedCursorPaginator if isinstance(_list, list) else CursorPaginator
+    )
+    paginator = paginator_class(_list, settings.POSTS_PER_PAGE, keys)
+    return paginator.get_page(
+        request.GET.get('page'),
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
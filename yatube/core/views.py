@@ -1,4 +1,10 @@
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+
+from core import metrics as core_metrics
 
 
 def page_not_found(request, exception):
@@ -20,3 +26,23 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+def has_metrics_token(request):
+    token = settings.METRICS_TOKEN
+    return bool(token) and constant_time_compare(
+        request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}')
+
+
+def metrics(request):
+    """Metrics for staff or scrapers with the ``METRICS_TOKEN``."""
+    if not has_metrics_token(request):
+        return staff_member_required(render_metrics)(request)
+    return render_metrics(request)
+
+
+def render_metrics(request):
+    return HttpResponse(
+        core_metrics.render(),
+        content_type='text/plain; version=0.0.4',
+    )
@@ -0,0 +1,99 @@
+"""Work done once per process before the first request.
+
+A fresh worker imports the views of every app on the first URL
+resolution and compiles each template on its first render. ``warm_up``
+does this at start-up, from ``yatube.wsgi``: it resolves the URLconf,
+imports the modules of installed apps and, for engines with the cached
+loader, compiles every template of their ``DIRS`` into the cache.
+Without the cached loader compiled templates would be dropped, so they
+are skipped.
+"""
+import importlib.util
+import logging
+import os
+import time
+
+from django.apps import apps
+from django.template import TemplateSyntaxError, engines
+from django.template.loaders.cached import Loader as CachedLoader
+from django.urls import get_resolver
+
+from core import metrics
+
+logger = logging.getLogger(__name__)
+
+APP_MODULES = ('views', 'forms', 'signals', 'admin')
+TEMPLATE_EXTENSIONS = ('.html', '.txt')
+
+
+def import_apps():
+    """Import the usual modules of installed apps; return their number."""
+    imported = 0
+    for config in apps.get_app_configs():
+        for module in APP_MODULES:
+            name = f'{config.name}.{module}'
+            if importlib.util.find_spec(name) is not None:
+                importlib.import_module(name)
+                imported += 1
+    return imported
+
+
+def resolve_urls():
+    """Import the URLconf and build the reverse lookup tables."""
+    resolver = get_resolver()
+    # Reading the property populates it.
+    resolver.reverse_dict
+    return len(resolver.url_patterns)
+
+
+def template_names(directory):
+    for root, _, files in os.walk(directory):
+        for file in files:
+            if file.endswith(TEMPLATE_EXTENSIONS):
+                path = os.path.join(root, file)
+                yield os.path.relpath(path, directory).replace(os.sep, '/')
+
+
+def compile_templates():
+    """Load every template into the cached loaders; return their number."""
+    compiled = 0
+    for engine in engines.all():
+        django_engine = getattr(engine, 'engine', None)
+        if django_engine is None or not any(
+            isinstance(loader, CachedLoader)
+            for loader in django_engine.template_loaders
+        ):
+            continue
+        for directory in django_engine.dirs:
+            for name in template_names(directory):
+                try:
+                    engine.get_template(name)
+                except TemplateSyntaxError:
+                    logger.exception('Cannot compile template %s', name)
+                    continue
+                compiled += 1
+    return compiled
+
+
+def warm_up():
+    """Run every warm-up step; return ``{step: (count, seconds)}``."""
+    report = {}
+    for step, function in (
+        ('apps', import_apps),
+        ('urls', resolve_urls),
+        ('templates', compile_templates),
+    ):
+        start = time.perf_counter()
+        count = function()
+        seconds = time.perf_counter() - start
+        metrics.set_value(
+            metrics.labelled('warmup_seconds', step=step), seconds)
+        report[step] = count, seconds
+    logger.info(
+        'Warmed up: %s',
+        ', '.join(
+            f'{step} {count} in {seconds * 1000:.0f} ms'
+            for step, (count, seconds) in report.items()
+        ),
+    )
+    return report
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from posts.models import Group, Post, Comment, Follow
+from posts.models import Group, Post, Comment, Follow, UserStats
 
 
 @admin.register(Group)
@@ -35,3 +35,14 @@ class CommentAdmin(admin.ModelAdmin):
 
 
 admin.site.register(Follow)
+
+
+@admin.register(UserStats)
+class UserStatsAdmin(admin.ModelAdmin):
+    list_display = (
+        'user',
+        'posts_count',
+        'followers_count',
+        'following_count',
+    )
+    search_fields = ('user__username',)
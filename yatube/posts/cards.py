@@ -0,0 +1,56 @@
+"""Rendered post cards cached per post version and display flags."""
+from django.conf import settings
+from django.db.models import prefetch_related_objects
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from core.caching import get_many_or_set
+from posts import thumbnails
+from posts.models import Post
+
+CARD_TEMPLATE = 'posts/includes/post.html'
+CARD_THUMBNAIL = 'card'
+
+
+def card_key(post, show_author, show_group_link):
+    return 'post_card:{}:{}:{:d}{:d}'.format(
+        post.pk,
+        post.updated.timestamp(),
+        show_author,
+        show_group_link,
+    )
+
+
+def render_cards(posts, show_author=False, show_group_link=False):
+    """HTML of the post cards; only cache misses are rendered.
+
+    Thumbnails and image variants of the missed posts are looked up in
+    one batch.
+    """
+    posts = {
+        card_key(post, show_author, show_group_link): post
+        for post in posts
+    }
+
+    def render(keys):
+        missed = [posts[key] for key in keys]
+        prefetch_related_objects(
+            [post for post in missed if post.image], 'image_variants')
+        thumbnails.prefetch_thumbnails(missed, CARD_THUMBNAIL)
+        return {
+            key: render_to_string(CARD_TEMPLATE, {
+                'post': posts[key],
+                'show_author': show_author,
+                'show_group_link': show_group_link,
+            })
+            for key in keys
+        }
+
+    return get_many_or_set(
+        list(posts), render, settings.POST_CARD_CACHE_TIMEOUT, 'post_cards',
+    )
+
+
+def touch_posts(**filters):
+    """Bump the version of the matching posts' cached cards."""
+    Post.objects.filter(**filters).update(updated=timezone.now())
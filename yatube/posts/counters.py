@@ -0,0 +1,100 @@
+"""Denormalized counters of users and posts.
+
+The counters are changed with ``F()`` updates from model signals, so they
+are written in the same transaction as the row that changes them.
+``rebuild_users`` and ``rebuild_posts`` reconcile them with the real
+tables in chunks.
+"""
+from django.db import transaction
+from django.db.models import Count, F
+
+from posts.models import Comment, Follow, Post, User, UserStats
+
+
+def _change(queryset, field, delta):
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def change_user(user_id, field, delta):
+    _change(UserStats.objects.filter(user_id=user_id), field, delta)
+
+
+def change_comments(post_id, delta):
+    _change(Post.objects.filter(pk=post_id), 'comments_count', delta)
+
+
+def chunks(queryset, chunk_size):
+    """Primary keys of ``queryset`` in ascending chunks."""
+    last = 0
+    while True:
+        pks = list(
+            queryset.filter(pk__gt=last).order_by('pk').values_list(
+                'pk', flat=True,
+            )[:chunk_size]
+        )
+        if not pks:
+            return
+        yield pks
+        last = pks[-1]
+
+
+def _count_by(queryset, field, pks):
+    return dict(
+        queryset.filter(**{f'{field}__in': pks}).values(field).annotate(
+            total=Count('pk'),
+        ).values_list(field, 'total')
+    )
+
+
+def rebuild_users(chunk_size=1000):
+    """Recount ``UserStats`` and return the number of fixed rows."""
+    fixed = 0
+    for pks in chunks(User.objects.all(), chunk_size):
+        actual = {
+            'posts_count': _count_by(Post.objects, 'author_id', pks),
+            'followers_count': _count_by(Follow.objects, 'author_id', pks),
+            'following_count': _count_by(Follow.objects, 'user_id', pks),
+        }
+        with transaction.atomic():
+            stats = {
+                item.user_id: item for item in
+                UserStats.objects.select_for_update().filter(user_id__in=pks)
+            }
+            missing = []
+            changed = []
+            for pk in pks:
+                values = {
+                    field: counts.get(pk, 0)
+                    for field, counts in actual.items()
+                }
+                item = stats.get(pk)
+                if item is None:
+                    missing.append(UserStats(user_id=pk, **values))
+                elif any(getattr(item, f) != v for f, v in values.items()):
+                    for field, value in values.items():
+                        setattr(item, field, value)
+                    changed.append(item)
+            UserStats.objects.bulk_create(missing)
+            UserStats.objects.bulk_update(changed, list(actual))
+        fixed += len(missing) + len(changed)
+    return fixed
+
+
+def rebuild_posts(chunk_size=1000):
+    """Recount ``Post.comments_count`` and return the number of fixed rows."""
+    fixed = 0
+    for pks in chunks(Post.objects.all(), chunk_size):
+        actual = _count_by(Comment.objects, 'post_id', pks)
+        with transaction.atomic():
+            changed = []
+            for post in Post.objects.select_for_update().filter(
+                pk__in=pks,
+            ).only('pk', 'comments_count'):
+                if post.comments_count != actual.get(post.pk, 0):
+                    post.comments_count = actual.get(post.pk, 0)
+                    changed.append(post)
+            Post.objects.bulk_update(changed, ['comments_count'])
+        fixed += len(changed)
+    return fixed
@@ -0,0 +1,147 @@
+"""Follow feeds: fan-out on write with pull for popular authors.
+
+Every new post is copied into the ``FeedItem`` rows of the author's
+followers, so reading a feed is a single range scan over the
+``(user, -created, -post)`` index instead of an ``IN`` subquery sort.
+
+Authors with more than ``FEED_PUSH_FOLLOWER_LIMIT`` followers are not
+pushed: their timelines are read at request time and k-way merged with
+the materialized feed by ``(created, id)``. When such an author drops
+back to the limit, the posts written meanwhile are backfilled into the
+feeds of the remaining followers in the background.
+"""
+from django.conf import settings
+from django.db.models import F
+
+from core import background, metrics
+from posts import counters
+from posts.models import FeedItem, Follow, Post, UserStats
+
+FEED_KEYS = ('feed_created', 'feed_post')
+BATCH_SIZE = 500
+
+
+def is_pulled(author_id):
+    """Whether the author has too many followers to push posts to."""
+    limit = settings.FEED_PUSH_FOLLOWER_LIMIT
+    metrics.set_value('feed_push_follower_limit', limit)
+    return UserStats.objects.filter(
+        user_id=author_id, followers_count__gt=limit,
+    ).exists()
+
+
+def pulled_authors(user):
+    """Ids of the popular authors the user follows."""
+    limit = settings.FEED_PUSH_FOLLOWER_LIMIT
+    metrics.set_value('feed_push_follower_limit', limit)
+    return list(
+        user.follower.filter(
+            author__stats__followers_count__gt=limit,
+        ).values_list('author_id', flat=True)
+    )
+
+
+def get_feed(user):
+    """Sources of the user's feed, paginated together by ``FEED_KEYS``."""
+    posts = Post.objects.select_related('author', 'group')
+    pushed = posts.filter(feed_items__user=user).annotate(
+        feed_created=F('feed_items__created'),
+        feed_post=F('feed_items__post_id'),
+    )
+    pulled = [
+        posts.filter(author_id=author_id).annotate(
+            feed_created=F('created'),
+            feed_post=F('pk'),
+        )
+        for author_id in pulled_authors(user)
+    ]
+    metrics.incr('feed_reads_total')
+    metrics.incr('feed_pull_sources_total', len(pulled))
+    return [pushed, *pulled]
+
+
+def push_post(post):
+    """Deliver a new post to the feeds of all of its author's followers."""
+    if is_pulled(post.author_id):
+        metrics.incr('feed_pull_posts_total')
+        return
+    followers = Follow.objects.filter(
+        author_id=post.author_id,
+    ).values_list('user_id', flat=True)
+    with metrics.timer('feed_push_seconds_total'):
+        items = FeedItem.objects.bulk_create(
+            (
+                FeedItem(
+                    user_id=user_id,
+                    post_id=post.pk,
+                    author_id=post.author_id,
+                    created=post.created,
+                )
+                for user_id in followers.iterator()
+            ),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+    metrics.incr('feed_push_posts_total')
+    metrics.incr('feed_push_rows_total', len(items))
+
+
+def backfill(user_id, author_id):
+    """Copy the author's latest posts into a new follower's feed."""
+    if is_pulled(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).values_list(
+        'pk', 'created',
+    )[:settings.FEED_MAX_LENGTH]
+    FeedItem.objects.bulk_create(
+        (
+            FeedItem(
+                user_id=user_id,
+                post_id=pk,
+                author_id=author_id,
+                created=created,
+            )
+            for pk, created in posts
+        ),
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    trim(user_id)
+
+
+def backfill_followers(author_id):
+    """Backfill the feeds of all followers of an author pushed again."""
+    followers = Follow.objects.filter(author_id=author_id).order_by('pk')
+    with metrics.timer('feed_backfill_seconds_total'):
+        for pks in counters.chunks(followers, BATCH_SIZE):
+            for user_id in followers.filter(pk__in=pks).values_list(
+                'user_id', flat=True,
+            ):
+                backfill(user_id, author_id)
+    metrics.incr('feed_backfill_authors_total')
+
+
+def drop_author(user_id, author_id):
+    """Remove an unfollowed author's posts from the user's feed.
+
+    If the unfollow brings the author back to the push limit, the feeds
+    of the remaining followers are backfilled in the background.
+    """
+    FeedItem.objects.filter(user_id=user_id, author_id=author_id).delete()
+    followers = Follow.objects.filter(author_id=author_id).count()
+    if followers == settings.FEED_PUSH_FOLLOWER_LIMIT:
+        background.after_commit(backfill_followers, author_id)
+
+
+def trim(user_id):
+    """Keep only the newest ``FEED_MAX_LENGTH`` items of the feed."""
+    limit = settings.FEED_MAX_LENGTH
+    boundary = list(
+        FeedItem.objects.filter(user_id=user_id).order_by(
+            '-created', '-post',
+        ).values_list('created', flat=True)[limit - 1:limit + 1]
+    )
+    if len(boundary) > 1:
+        FeedItem.objects.filter(
+            user_id=user_id, created__lt=boundary[0],
+        ).delete()
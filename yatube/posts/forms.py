@@ -1,6 +1,8 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 
 from posts.models import Post, Comment
+from posts.uploads import bound_image
 
 
 class PostForm(forms.ModelForm):
@@ -13,6 +15,12 @@ class PostForm(forms.ModelForm):
             'Группа еще не выбрана'
         )
 
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        if isinstance(image, UploadedFile):
+            return bound_image(image)
+        return image
+
     class Meta:
         model = Post
         fields = ('text', 'group', 'image')
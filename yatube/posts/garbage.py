@@ -0,0 +1,152 @@
+"""Collection of media files nothing refers to any more.
+
+Replaced images, variants of crashed generations and sorl thumbnails of
+deleted sources stay on disk. Every step here streams: the media tree is
+walked with ``os.scandir`` and names are checked against the database in
+batches, so memory does not grow with the number of files.
+
+Files younger than ``MEDIA_GC_MIN_AGE`` seconds are never collected, as
+they may belong to an upload whose transaction is not committed yet;
+storing identical content again refreshes the age of a file.
+"""
+import itertools
+import os
+import time
+
+from django.db import transaction
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix, del_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core.models import StoredFile
+from posts.models import Post, PostImageVariant
+
+IMAGE_DIRECTORY = 'posts'
+
+
+def batches(iterable, size):
+    """Lists of up to ``size`` consecutive items of ``iterable``."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def walk(storage, directory, min_age):
+    """Names of files under ``directory`` older than ``min_age`` seconds."""
+    cutoff = time.time() - min_age
+    pending = [directory]
+    while pending:
+        directory = pending.pop()
+        try:
+            entries = os.scandir(storage.path(directory))
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                name = f'{directory}/{entry.name}'
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(name)
+                elif entry.stat().st_mtime < cutoff:
+                    yield name
+
+
+def referenced_images(names):
+    """Those of ``names`` that posts or their variants refer to."""
+    return set(
+        Post.objects.filter(image__in=names).values_list('image', flat=True)
+    ) | set(
+        PostImageVariant.objects.filter(image__in=names).values_list(
+            'image', flat=True,
+        )
+    )
+
+
+def orphan_images(min_age, batch_size):
+    """Names of unreferenced files of post images and variants."""
+    storage = Post._meta.get_field('image').storage
+    for names in batches(
+        walk(storage, IMAGE_DIRECTORY, min_age), batch_size,
+    ):
+        referenced = referenced_images(names)
+        yield from (name for name in names if name not in referenced)
+
+
+def delete_image(name, min_age):
+    """Delete an orphaned image unless it got referenced meanwhile.
+
+    The checks are repeated under the lock of its ``StoredFile`` row,
+    which ``ContentAddressedStorage`` takes to add a reference: a
+    concurrent upload of the same content either shows up in them or
+    waits and writes the file anew. An image gone already counts as
+    collected by someone else.
+    """
+    storage = Post._meta.get_field('image').storage
+    with transaction.atomic():
+        StoredFile.objects.select_for_update().filter(name=name).first()
+        if referenced_images([name]):
+            return False
+        try:
+            if os.stat(storage.path(name)).st_mtime >= time.time() - min_age:
+                return False
+        except FileNotFoundError:
+            return False
+        # Leaked references must not keep an unused file.
+        StoredFile.objects.filter(name=name).delete()
+        storage.delete(name)
+    return True
+
+
+def orphan_sources(batch_size):
+    """Source ``ImageFile``s with thumbnails whose post image is gone."""
+    lists = KVStoreModel.objects.filter(
+        key__startswith=add_prefix('', identity='thumbnails'),
+    ).order_by('key')
+    last = ''
+    while True:
+        batch = list(
+            lists.filter(key__gt=last).values_list('key', flat=True)[
+                :batch_size
+            ]
+        )
+        if not batch:
+            return
+        last = batch[-1]
+        sources = [
+            deserialize_image_file(value)
+            for value in KVStoreModel.objects.filter(
+                key__in=[add_prefix(del_prefix(key)) for key in batch],
+            ).values_list('value', flat=True)
+        ]
+        referenced = set(
+            Post.objects.filter(
+                image__in=[source.name for source in sources],
+            ).values_list('image', flat=True)
+        )
+        yield from (
+            source for source in sources if source.name not in referenced
+        )
+
+
+def thumbnail_count(source):
+    return len(default.kvstore._get(source.key, identity='thumbnails') or [])
+
+
+def orphan_thumbnails(min_age, batch_size):
+    """Names of thumbnail files the sorl key-value store does not know."""
+    storage = default.storage
+    directory = thumbnail_settings.THUMBNAIL_PREFIX.rstrip('/')
+    for names in batches(walk(storage, directory, min_age), batch_size):
+        keys = {
+            add_prefix(ImageFile(name, storage).key): name for name in names
+        }
+        known = set(
+            KVStoreModel.objects.filter(key__in=keys).values_list(
+                'key', flat=True,
+            )
+        )
+        yield from (name for key, name in keys.items() if key not in known)
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+from posts.models import Post
+
+FIELDS = ('image_width', 'image_height', 'image_placeholder')
+
+
+class Command(BaseCommand):
+    help = (
+        'Store the size and placeholder of post images saved before '
+        'they were computed on upload.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=100,
+            help='Posts loaded and updated per query.',
+        )
+
+    def handle(self, *args, chunk_size, **options):
+        described = skipped = 0
+        posts = Post.objects.exclude(image='').filter(image_width=None)
+        for pks in counters.chunks(posts, chunk_size):
+            chunk = list(Post.objects.filter(pk__in=pks).only('image'))
+            for post in chunk:
+                post.describe_image()
+                post.image.close()
+                if post.image_width is None:
+                    skipped += 1
+                else:
+                    described += 1
+            Post.objects.bulk_update(chunk, FIELDS)
+        self.stdout.write(
+            f'Described {described} images, skipped {skipped} unreadable.'
+        )
@@ -0,0 +1,73 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import default
+
+from core.throttling import Throttle
+from posts import garbage
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete post images, variants and sorl thumbnails that nothing '
+        'refers to any more.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only list what would be deleted.',
+        )
+        parser.add_argument(
+            '--min-age',
+            type=int,
+            default=settings.MEDIA_GC_MIN_AGE,
+            help='Seconds since the last change of files to collect.',
+        )
+        parser.add_argument(
+            '--max-rate',
+            type=float,
+            default=settings.MEDIA_GC_RATE,
+            help='Files deleted per second, 0 for no limit.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Names checked per query.',
+        )
+
+    def handle(self, *args, dry_run, min_age, max_rate, batch_size,
+               verbosity, **options):
+        throttle = Throttle(0 if dry_run else max_rate)
+        verb = 'Would delete' if dry_run else 'Deleted'
+
+        def report(name):
+            if verbosity > 1 or dry_run:
+                self.stdout.write(f'{verb} {name}')
+
+        images = 0
+        for name in garbage.orphan_images(min_age, batch_size):
+            throttle.consume(1)
+            if dry_run or garbage.delete_image(name, min_age):
+                images += 1
+                report(name)
+        sources = thumbnails = 0
+        for source in garbage.orphan_sources(batch_size):
+            count = garbage.thumbnail_count(source)
+            throttle.consume(count + 1)
+            if not dry_run:
+                default.kvstore.delete(source)
+            sources += 1
+            thumbnails += count
+            report(f'{count} thumbnails of {source.name}')
+        for name in garbage.orphan_thumbnails(min_age, batch_size):
+            throttle.consume(1)
+            if not dry_run:
+                default.storage.delete(name)
+            thumbnails += 1
+            report(name)
+        self.stdout.write(
+            f'{verb} {images} images, thumbnails of {sources} gone sources, '
+            f'{thumbnails} thumbnails in total.'
+        )
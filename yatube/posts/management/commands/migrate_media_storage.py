@@ -0,0 +1,50 @@
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand
+from sorl.thumbnail import delete
+from sorl.thumbnail.images import ImageFile
+
+from posts import counters
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Move post images saved before the content-addressed storage '
+        'into it and delete their old thumbnails; regenerate_thumbnails '
+        'creates new ones.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=100,
+            help='Posts loaded per query.',
+        )
+
+    def handle(self, *args, chunk_size, **options):
+        storage = Post._meta.get_field('image').storage
+        legacy = FileSystemStorage(location=storage.location)
+        moved = skipped = 0
+        posts = Post.objects.exclude(image='')
+        for pks in counters.chunks(posts, chunk_size):
+            for pk, name in posts.filter(pk__in=pks).values_list(
+                'pk', 'image',
+            ):
+                if storage.is_addressed(name) or not legacy.exists(name):
+                    skipped += 1
+                    continue
+                with legacy.open(name) as content:
+                    addressed = storage.save(name, content)
+                Post.objects.filter(pk=pk).update(image=addressed)
+                # Thumbnails are keyed by the storage class of the source:
+                # the default one before the move, this one after it.
+                delete(ImageFile(name, storage), delete_file=False)
+                delete(ImageFile(name, legacy))
+                moved += 1
+        self.stdout.write(
+            f'Moved {moved} images, skipped {skipped} addressed or missing.'
+        )
+        if moved:
+            self.stdout.write(
+                'Run regenerate_thumbnails to create their thumbnails.')
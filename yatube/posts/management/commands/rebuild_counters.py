@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters
+
+
+class Command(BaseCommand):
+    help = 'Reconcile post, comment and follower counters in chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Rows recounted per transaction.',
+        )
+
+    def handle(self, *args, chunk_size, **options):
+        users = counters.rebuild_users(chunk_size)
+        posts = counters.rebuild_posts(chunk_size)
+        self.stdout.write(
+            f'Fixed counters of {users} users and {posts} posts.'
+        )
@@ -0,0 +1,132 @@
+import multiprocessing
+import os
+import time
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+
+from core.throttling import Throttle
+from posts import counters, thumbnails
+from posts.models import Post
+
+
+def read_checkpoint(path):
+    """Last post pk recorded in the checkpoint file, 0 if there is none."""
+    try:
+        with open(path) as file:
+            return int(file.read())
+    except (OSError, ValueError):
+        return 0
+
+
+def write_checkpoint(path, pk):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path + '.tmp', 'w') as file:
+        file.write(str(pk))
+    os.replace(path + '.tmp', path)
+
+
+class Command(BaseCommand):
+    help = (
+        'Regenerate thumbnails and variants of every post image in a '
+        'process pool, resuming after the last finished chunk.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=100,
+            help='Posts regenerated between checkpoints.',
+        )
+        parser.add_argument(
+            '--processes',
+            type=int,
+            default=os.cpu_count(),
+            help='Worker processes, 1 to work in this process.',
+        )
+        parser.add_argument(
+            '--max-rate',
+            type=int,
+            default=settings.THUMBNAIL_REGENERATE_RATE,
+            help='Source image bytes read per second, 0 for no limit.',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default=settings.THUMBNAIL_REGENERATE_CHECKPOINT,
+            help='File that keeps the last regenerated post.',
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore the checkpoint and start from the first post.',
+        )
+
+    def handle(self, *args, chunk_size, processes, max_rate, checkpoint,
+               restart, **options):
+        start = 0 if restart else read_checkpoint(checkpoint)
+        if start:
+            self.stdout.write(f'Resuming after post {start}.')
+        posts = Post.objects.exclude(image='').filter(pk__gt=start)
+        throttle = Throttle(max_rate)
+        if processes > 1 and connection.vendor == 'sqlite':
+            # SQLite takes one writer at a time; parallel workers fail
+            # with "database is locked" rather than wait.
+            self.stderr.write(
+                'SQLite does not support concurrent writers, '
+                'regenerating in a single process.'
+            )
+            processes = 1
+        if processes <= 1:
+            self.regenerate(posts, chunk_size, checkpoint, throttle, map)
+        else:
+            # Forked workers must not share the parent's connections.
+            connections.close_all()
+            pool = multiprocessing.Pool(processes)
+            try:
+                self.regenerate(
+                    posts, chunk_size, checkpoint, throttle,
+                    pool.imap_unordered,
+                )
+            except BaseException:
+                pool.terminate()
+                raise
+            pool.close()
+            pool.join()
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+
+    def regenerate(self, posts, chunk_size, checkpoint, throttle, imap):
+        """Regenerate ``posts`` chunk by chunk with ``imap`` of workers."""
+        storage = Post._meta.get_field('image').storage
+
+        def throttled(pks):
+            for pk, name in posts.filter(pk__in=pks).order_by(
+                'pk',
+            ).values_list('pk', 'image'):
+                try:
+                    throttle.consume(storage.size(name))
+                except (OSError, SuspiciousFileOperation):
+                    pass
+                yield pk
+
+        total = posts.count()
+        done = failed = 0
+        started = time.monotonic()
+        for pks in counters.chunks(posts, chunk_size):
+            # Throttled before imap: the pool would run the generator in
+            # its task-handler thread.
+            for ready in imap(thumbnails.regenerate, list(throttled(pks))):
+                done += 1
+                failed += not ready
+            write_checkpoint(checkpoint, pks[-1])
+            rate = done / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(
+                f'Regenerated {done}/{total} posts, {failed} failed, '
+                f'{rate:.1f} posts/s.'
+            )
+        self.stdout.write(f'Done: {done} posts, {failed} failed.')
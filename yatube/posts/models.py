@@ -3,6 +3,8 @@ from django.db import models
 from django.urls import reverse_lazy
 
 from core.models import CreatedTextModel
+from core.storage import content_addressed_storage
+from posts.uploads import describe_image
 
 User = get_user_model()
 
@@ -51,17 +53,90 @@ class Post(CreatedTextModel):
     image = models.ImageField(
         verbose_name='Картинка',
         upload_to='posts/',
+        storage=content_addressed_storage,
         blank=True,
     )
+    image_width = models.PositiveIntegerField(
+        verbose_name='Ширина картинки',
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    image_height = models.PositiveIntegerField(
+        verbose_name='Высота картинки',
+        blank=True,
+        null=True,
+        editable=False,
+    )
+    image_placeholder = models.TextField(
+        verbose_name='Заглушка картинки',
+        blank=True,
+        editable=False,
+    )
+    updated = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+    )
+    comments_count = models.PositiveIntegerField(
+        verbose_name='Комментариев',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
         ordering = ('-created',)
+        indexes = (
+            models.Index(
+                fields=['-created', '-id'],
+                name='post_created_idx',
+            ),
+            models.Index(
+                fields=['author', '-created', '-id'],
+                name='post_author_created_idx',
+            ),
+            models.Index(
+                fields=['group', '-created', '-id'],
+                name='post_group_created_idx',
+            ),
+        )
 
     def __str__(self):
         return f'{self.text[:15]}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        post = super().from_db(db, field_names, values)
+        if 'group_id' in post.__dict__:
+            post._loaded_group_id = post.group_id
+        return post
+
+    @property
+    def group_changed(self):
+        """Whether ``group`` differs from the one loaded from the database."""
+        return self.group_id != getattr(
+            self, '_loaded_group_id', self.group_id)
+
+    def save(self, *args, **kwargs):
+        if not self.image:
+            self.image_width = self.image_height = None
+            self.image_placeholder = ''
+        elif not self.image._committed:
+            self.describe_image()
+        super().save(*args, **kwargs)
+        self._loaded_group_id = self.group_id
+
+    def describe_image(self):
+        """Store the size and placeholder of the image, if readable."""
+        try:
+            (
+                self.image_width, self.image_height, self.image_placeholder,
+            ) = describe_image(self.image)
+        except Exception:
+            self.image_width = self.image_height = None
+            self.image_placeholder = ''
+
     def get_absolute_url(self):
         return reverse_lazy('posts:post_detail', args=(self.pk,))
 
@@ -84,6 +159,13 @@ class Comment(CreatedTextModel):
     class Meta:
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
+        ordering = ('created',)
+        indexes = (
+            models.Index(
+                fields=['post', 'created'],
+                name='comment_post_created_idx',
+            ),
+        )
 
     def __str__(self):
         return f'{self.text}'
@@ -117,3 +199,121 @@ class Follow(models.Model):
 
     def __str__(self):
         return f'{self.user} подписан на {self.author}'
+
+
+class UserStats(models.Model):
+    """Counters of a user kept up to date by ``posts.counters``."""
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='stats',
+    )
+    posts_count = models.PositiveIntegerField(
+        verbose_name='Постов',
+        default=0,
+    )
+    followers_count = models.PositiveIntegerField(
+        verbose_name='Подписчиков',
+        default=0,
+    )
+    following_count = models.PositiveIntegerField(
+        verbose_name='Подписок',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Счетчики пользователя'
+        verbose_name_plural = 'Счетчики пользователей'
+
+    def __str__(self):
+        return f'Счетчики {self.user}'
+
+
+class FeedItem(models.Model):
+    """Post delivered to the feed of one of the author's followers."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Подписчик',
+        related_name='feed_items',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        verbose_name='Пост',
+        related_name='feed_items',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Автор',
+        related_name='+',
+    )
+    created = models.DateTimeField(
+        verbose_name='Дата публикации',
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = (
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_feed_item',
+            ),
+        )
+        indexes = (
+            models.Index(
+                fields=['user', '-created', '-post'],
+                name='feed_user_created_idx',
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='feed_user_author_idx',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.post} в ленте {self.user}'
+
+
+class PostImageVariant(models.Model):
+    """Resized copy of a post image in one width and format."""
+
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        verbose_name='Пост',
+        related_name='image_variants',
+    )
+    image = models.ImageField(
+        verbose_name='Картинка',
+        upload_to='posts/variants/',
+        storage=content_addressed_storage,
+    )
+    format = models.CharField(
+        verbose_name='Формат',
+        max_length=10,
+    )
+    width = models.PositiveIntegerField(
+        verbose_name='Ширина',
+    )
+    height = models.PositiveIntegerField(
+        verbose_name='Высота',
+    )
+
+    class Meta:
+        verbose_name = 'Вариант картинки'
+        verbose_name_plural = 'Варианты картинок'
+        constraints = (
+            models.UniqueConstraint(
+                fields=['post', 'format', 'width'],
+                name='unique_image_variant',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.image.name} {self.width}x{self.height}'
@@ -0,0 +1,104 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from core.storage import release_on_commit
+from core.utils import bump_count_version
+from posts import counters, feeds
+from posts.cards import touch_posts
+from posts.models import (
+    Comment, Follow, Group, Post, PostImageVariant, User, UserStats,
+)
+
+CARD_USER_FIELDS = {'username', 'first_name', 'last_name'}
+
+
+@receiver(post_save, sender=User)
+def create_stats(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def count_post(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user(instance.author_id, 'posts_count', 1)
+
+
+@receiver(post_delete, sender=Post)
+def uncount_post(sender, instance, **kwargs):
+    counters.change_user(instance.author_id, 'posts_count', -1)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, **kwargs):
+    if created:
+        counters.change_comments(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    counters.change_comments(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_follow(sender, instance, created, **kwargs):
+    if created:
+        counters.change_user(instance.author_id, 'followers_count', 1)
+        counters.change_user(instance.user_id, 'following_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def uncount_follow(sender, instance, **kwargs):
+    counters.change_user(instance.author_id, 'followers_count', -1)
+    counters.change_user(instance.user_id, 'following_count', -1)
+
+
+@receiver(post_save, sender=Post)
+def deliver_post(sender, instance, created, **kwargs):
+    if created:
+        feeds.push_post(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_feed(sender, instance, created, **kwargs):
+    if created:
+        feeds.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def drop_from_feed(sender, instance, **kwargs):
+    feeds.drop_author(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Follow)
+def invalidate_counts(sender, instance, created, **kwargs):
+    if created or sender is Post and instance.group_changed:
+        bump_count_version()
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Follow)
+def invalidate_counts_on_delete(sender, **kwargs):
+    bump_count_version()
+
+
+@receiver(post_save, sender=Group)
+def refresh_group_cards(sender, instance, created, **kwargs):
+    if not created:
+        touch_posts(group=instance)
+
+
+@receiver(post_save, sender=User)
+def refresh_author_cards(sender, instance, created, update_fields,
+                         **kwargs):
+    if created or update_fields and not CARD_USER_FIELDS & update_fields:
+        return
+    touch_posts(author=instance)
+
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=PostImageVariant)
+def release_image(sender, instance, **kwargs):
+    if instance.image:
+        release_on_commit(instance.image)
@@ -0,0 +1,15 @@
+from django import template
+
+from posts import thumbnails
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_thumbnail(post, name):
+    return thumbnails.post_thumbnail(post, name)
+
+
+@register.simple_tag
+def post_sources(post):
+    return thumbnails.picture_sources(post)
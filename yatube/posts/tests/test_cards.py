@@ -0,0 +1,74 @@
+from django.core.cache import cache
+from django.test import TestCase, Client
+from django.urls import reverse
+
+from posts.models import User, Group, Post
+
+CARD_TEMPLATE = 'posts/includes/post.html'
+
+
+class PostCardCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+        cls.group = Group.objects.create(
+            title='Группа',
+            slug='group',
+            description='Для постов',
+        )
+        cls.post = Post.objects.create(
+            text='Текст поста',
+            author=cls.author,
+            group=cls.group,
+        )
+        cls.url = reverse('posts:profile', args=(cls.author.username,))
+
+    def setUp(self):
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_card_rendered_once(self):
+        """Повторный показ поста берет карточку из кэша."""
+        response = self.client.get(self.url)
+        self.assertTemplateUsed(response, CARD_TEMPLATE)
+        response = self.client.get(self.url)
+        self.assertTemplateNotUsed(response, CARD_TEMPLATE)
+        self.assertContains(response, self.post.text)
+
+    def test_card_flags_cached_separately(self):
+        """Карточки с разными флагами кэшируются отдельно."""
+        self.client.get(self.url)
+        response = self.client.get(
+            reverse('posts:group_list', args=(self.group.slug,)))
+        self.assertTemplateUsed(response, CARD_TEMPLATE)
+
+    def test_card_invalidated_by_edit(self):
+        """Редактирование поста сбрасывает его карточку."""
+        self.client.get(self.url)
+        self.author_client.post(
+            reverse('posts:post_edit', args=(self.post.pk,)),
+            {'text': 'Новый текст', 'group': self.group.pk},
+        )
+        self.assertContains(self.client.get(self.url), 'Новый текст')
+
+    def test_card_invalidated_by_group_rename(self):
+        """Переименование группы сбрасывает карточки ее постов."""
+        self.client.get(self.url)
+        self.group.title = 'Новое название'
+        self.group.save()
+        self.assertContains(self.client.get(self.url), 'Новое название')
+
+    def test_card_invalidated_by_author_rename(self):
+        """Смена имени автора сбрасывает карточки его постов."""
+        group_url = reverse('posts:group_list', args=(self.group.slug,))
+        self.client.get(group_url)
+        self.author.first_name = 'Лев'
+        self.author.save()
+        self.assertContains(self.client.get(group_url), 'Лев')
+        self.author.save(update_fields=['last_login'])
+        response = self.client.get(group_url)
+        self.assertTemplateNotUsed(response, CARD_TEMPLATE)
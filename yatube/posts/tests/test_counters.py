@@ -0,0 +1,82 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, Client
+from django.urls import reverse
+
+from posts.models import User, Post, Comment, Follow, UserStats
+
+
+class CounterTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+        cls.reader = User.objects.create(username='reader')
+
+    def setUp(self):
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_post_counters(self):
+        """Счетчик постов меняется при создании и удалении поста."""
+        self.author_client.post(
+            reverse('posts:post_create'), {'text': 'Новый пост'})
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        Post.objects.get().delete()
+        self.assertEqual(self.stats(self.author).posts_count, 0)
+
+    def test_comment_counters(self):
+        """Счетчик комментариев меняется при добавлении и удалении."""
+        post = Post.objects.create(text='Пост', author=self.author)
+        self.reader_client.post(
+            reverse('posts:add_comment', args=(post.pk,)),
+            {'text': 'Комментарий'},
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        Comment.objects.all().delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+
+    def test_follow_counters(self):
+        """Счетчики подписок меняются при подписке и отписке."""
+        self.reader_client.get(
+            reverse('posts:profile_follow', args=(self.author.username,)))
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        self.reader_client.get(
+            reverse('posts:profile_unfollow', args=(self.author.username,)))
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_profile_does_not_count_posts(self):
+        """Страница профиля берет число постов из счетчика."""
+        Post.objects.create(text='Пост', author=self.author)
+        response = self.client.get(
+            reverse('posts:profile', args=(self.author.username,)))
+        self.assertContains(response, 'Всего постов: 1')
+
+    def test_rebuild_counters(self):
+        """Команда rebuild_counters исправляет разошедшиеся счетчики."""
+        post = Post.objects.create(text='Пост', author=self.author)
+        Comment.objects.create(text='Текст', post=post, author=self.reader)
+        Follow.objects.create(user=self.reader, author=self.author)
+        UserStats.objects.filter(user=self.author).update(
+            posts_count=10, followers_count=0)
+        UserStats.objects.filter(user=self.reader).delete()
+        Post.objects.update(comments_count=5)
+        out = StringIO()
+        call_command('rebuild_counters', chunk_size=1, stdout=out)
+        self.assertIn('2 users and 1 posts', out.getvalue())
+        author_stats = self.stats(self.author)
+        self.assertEqual(author_stats.posts_count, 1)
+        self.assertEqual(author_stats.followers_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
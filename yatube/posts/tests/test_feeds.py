@@ -0,0 +1,180 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.test import (
+    Client, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core import metrics
+from posts.models import User, Post, Follow, FeedItem
+
+
+class FeedTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+        cls.other = User.objects.create(username='other')
+        cls.reader = User.objects.create(username='reader')
+        cls.old_post = Post.objects.create(
+            text='Старый пост',
+            author=cls.author,
+        )
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def feed_posts(self):
+        return list(FeedItem.objects.filter(
+            user=self.reader,
+        ).values_list('post', flat=True))
+
+    def test_follow_backfills_feed(self):
+        """Подписка добавляет в ленту прежние посты автора."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.feed_posts(), [self.old_post.pk])
+
+    def test_new_post_pushed_to_followers(self):
+        """Новый пост доставляется в ленты подписчиков автора."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(text='Новый пост', author=self.author)
+        Post.objects.create(text='Чужой пост', author=self.other)
+        self.assertCountEqual(self.feed_posts(), [self.old_post.pk, post.pk])
+
+    def test_unfollow_drops_author_posts(self):
+        """Отписка убирает посты автора из ленты."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.reader, author=self.other)
+        post = Post.objects.create(text='Чужой пост', author=self.other)
+        self.reader_client.get(
+            reverse('posts:profile_unfollow', args=(self.author.username,)))
+        self.assertEqual(self.feed_posts(), [post.pk])
+
+    @override_settings(FEED_MAX_LENGTH=3)
+    def test_backfill_trims_feed(self):
+        """Лента не растет больше FEED_MAX_LENGTH записей при подписке."""
+        for i in range(4):
+            Post.objects.create(text=f'Пост {i}', author=self.other)
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.reader, author=self.other)
+        self.assertEqual(len(self.feed_posts()), 3)
+
+    def test_follow_index_reads_feed_table(self):
+        """Посты ленты подписок читаются из FeedItem
+        без подзапроса по Follow.
+        """
+        Follow.objects.create(user=self.reader, author=self.author)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.reader_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            [post.pk for post in response.context['page_obj']],
+            [self.old_post.pk],
+        )
+        for query in queries:
+            if 'posts_post' in query['sql']:
+                self.assertNotIn('posts_follow', query['sql'])
+
+
+@override_settings(FEED_PUSH_FOLLOWER_LIMIT=1)
+class HybridFeedTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.star = User.objects.create(username='star')
+        cls.author = User.objects.create(username='author')
+        cls.reader = User.objects.create(username='reader')
+        cls.fan = User.objects.create(username='fan')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        Follow.objects.create(user=cls.reader, author=cls.star)
+        Follow.objects.create(user=cls.fan, author=cls.star)
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_popular_author_is_not_pushed(self):
+        """Посты автора с числом подписчиков выше порога
+        не копируются в ленты.
+        """
+        before = metrics.snapshot().get('feed_pull_posts_total', 0)
+        post = Post.objects.create(text='Пост звезды', author=self.star)
+        self.assertFalse(FeedItem.objects.filter(post=post).exists())
+        self.assertEqual(
+            metrics.snapshot()['feed_pull_posts_total'], before + 1)
+        self.assertEqual(metrics.snapshot()['feed_push_follower_limit'], 1)
+
+    def test_feed_merges_pulled_timelines(self):
+        """Лента объединяет записанные и подтягиваемые при чтении посты."""
+        posts = [
+            Post.objects.create(text=f'Пост {i}', author=author)
+            for i, author in enumerate(
+                (self.author, self.star) * settings.POSTS_PER_PAGE)
+        ]
+        posts.reverse()
+        seen = []
+        params = {}
+        while True:
+            page_obj = self.reader_client.get(
+                reverse('posts:follow_index'), params,
+            ).context['page_obj']
+            seen.extend(post.pk for post in page_obj)
+            if not page_obj.has_next():
+                break
+            params = {'after': page_obj.next_cursor}
+        self.assertEqual(seen, [post.pk for post in posts])
+
+    def test_feed_shows_pushed_posts_once(self):
+        """Посты, доставленные до роста числа подписчиков,
+        не дублируются в ленте.
+        """
+        post = Post.objects.create(text='Пост', author=self.star)
+        FeedItem.objects.create(
+            user=self.reader,
+            post=post,
+            author=self.star,
+            created=post.created,
+        )
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            [post.pk for post in response.context['page_obj']], [post.pk])
+
+
+@override_settings(FEED_PUSH_FOLLOWER_LIMIT=1, BACKGROUND_WORKERS=0)
+class FeedBackfillTests(TransactionTestCase):
+    """Дозаполнение лент выполняется после фиксации транзакции."""
+
+    def setUp(self):
+        self.star = User.objects.create(username='star')
+        self.reader = User.objects.create(username='reader')
+        self.fan = User.objects.create(username='fan')
+        Follow.objects.create(user=self.reader, author=self.star)
+        Follow.objects.create(user=self.fan, author=self.star)
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_author_pushed_again_is_backfilled(self):
+        """Когда подписчиков снова не больше порога, посты, написанные
+        за время подтягивания, появляются в лентах.
+        """
+        post = Post.objects.create(text='Пост звезды', author=self.star)
+        self.assertFalse(FeedItem.objects.filter(post=post).exists())
+        Follow.objects.filter(user=self.fan, author=self.star).delete()
+        self.assertTrue(FeedItem.objects.filter(
+            user=self.reader, post=post).exists())
+        response = self.reader_client.get(reverse('posts:follow_index'))
+        self.assertIn(post, response.context['page_obj'])
+        later = Post.objects.create(text='Новый пост', author=self.star)
+        self.assertTrue(FeedItem.objects.filter(
+            user=self.reader, post=later).exists())
+
+    def test_backfill_waits_for_commit(self):
+        """Откаченная отписка не дозаполняет ленты."""
+        post = Post.objects.create(text='Пост звезды', author=self.star)
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                Follow.objects.filter(
+                    user=self.fan, author=self.star).delete()
+                raise RuntimeError
+        self.assertFalse(FeedItem.objects.filter(post=post).exists())
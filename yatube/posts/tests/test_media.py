@@ -0,0 +1,310 @@
+import io
+import os
+import shutil
+import tempfile
+import time
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import (
+    Client, TestCase, TransactionTestCase, override_settings,
+)
+from django.urls import reverse
+from PIL import Image
+from sorl.thumbnail import default
+
+from core.models import StoredFile
+from posts import garbage, thumbnails
+from posts.models import User, Post
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+def make_png(color):
+    content = io.BytesIO()
+    Image.new('RGB', (4, 2), color).save(content, 'PNG')
+    return content.getvalue()
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MediaStorageTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_migrate_media_storage(self):
+        """Команда переносит старые картинки в хранилище по хешу."""
+        legacy = FileSystemStorage()
+        name = legacy.save('posts/legacy.gif', ContentFile(SMALL_GIF))
+        post = Post.objects.create(text='Пост', author=self.author, image=name)
+        Post.objects.create(
+            text='Пропавшая картинка',
+            author=self.author,
+            image='posts/missing.gif',
+        )
+        thumbnails.generate(post.pk)
+        old_thumbnail = thumbnails.ready_thumbnail(post.image, 'card')
+        out = StringIO()
+        call_command('migrate_media_storage', stdout=out)
+        self.assertIn('Moved 1 images, skipped 1', out.getvalue())
+        self.assertIn('regenerate_thumbnails', out.getvalue())
+        self.assertFalse(legacy.exists(name))
+        self.assertFalse(default.storage.exists(old_thumbnail.name))
+        self.assertIsNone(thumbnails.ready_thumbnail(name, 'card'))
+        post.refresh_from_db()
+        self.assertTrue(post.image.storage.is_addressed(post.image.name))
+        self.assertEqual(post.image.read(), SMALL_GIF)
+        self.assertIsNone(thumbnails.ready_thumbnail(post.image, 'card'))
+
+    def test_backfill_image_metadata(self):
+        """Команда дописывает размер и заглушку старым картинкам."""
+        name = FileSystemStorage().save(
+            'posts/old.gif', ContentFile(SMALL_GIF))
+        post = Post.objects.create(text='Пост', author=self.author, image=name)
+        Post.objects.create(
+            text='Пропавшая картинка',
+            author=self.author,
+            image='posts/missing.gif',
+        )
+        out = StringIO()
+        call_command('backfill_image_metadata', chunk_size=1, stdout=out)
+        self.assertIn('Described 1 images, skipped 1', out.getvalue())
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (2, 1))
+        self.assertTrue(post.image_placeholder.startswith('data:image/'))
+
+    def test_render_does_not_open_images(self):
+        """Страницы с картинками рендерятся без чтения файлов."""
+        post = Post.objects.create(
+            text='Пост',
+            author=self.author,
+            image=SimpleUploadedFile(
+                name='small.gif',
+                content=SMALL_GIF,
+                content_type='image/gif',
+            ),
+        )
+        thumbnails.generate(post.pk)
+        cache.clear()
+        with mock.patch.object(
+            FileSystemStorage, 'open', side_effect=AssertionError,
+        ):
+            for url in (
+                reverse('posts:post_detail', args=(post.pk,)),
+                reverse('posts:profile', args=(self.author.username,)),
+            ):
+                with self.subTest(url=url):
+                    response = self.client.get(url)
+                    self.assertContains(response, 'width="')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, BACKGROUND_WORKERS=0)
+class SharedImageTests(TransactionTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.author = User.objects.create(username='author')
+
+    def tearDown(self):
+        cache.clear()
+
+    def create_post(self, name):
+        return Post.objects.create(
+            text='Пост',
+            author=self.author,
+            image=SimpleUploadedFile(name, SMALL_GIF, 'image/gif'),
+        )
+
+    def test_same_image_stored_once(self):
+        """Одна и та же картинка нескольких постов хранится один раз
+        и удаляется вместе с последним постом.
+        """
+        posts = [self.create_post(f'{i}.gif') for i in range(2)]
+        name = posts[0].image.name
+        storage = posts[0].image.storage
+        self.assertTrue(name.startswith('posts/'))
+        self.assertEqual(posts[1].image.name, name)
+        self.assertEqual(StoredFile.objects.get(name=name).refs, 2)
+        posts[0].delete()
+        self.assertTrue(storage.exists(name))
+        posts[1].delete()
+        self.assertFalse(storage.exists(name))
+
+    def test_shared_variants_released_once(self):
+        """Пересоздание вариантов одного поста не удаляет общие файлы
+        другого поста с той же картинкой.
+        """
+        posts = [self.create_post(f'{i}.gif') for i in range(2)]
+        for post in posts:
+            thumbnails.generate(post.pk)
+        shared = [variant.image for variant in posts[1].image_variants.all()]
+        self.assertTrue(shared)
+        thumbnails.generate(posts[0].pk)
+        thumbnails.delete_variants(posts[0])
+        for image in shared:
+            self.assertTrue(image.storage.exists(image.name))
+            self.assertEqual(StoredFile.objects.get(name=image.name).refs, 1)
+
+    def test_replaced_image_released(self):
+        """Замена картинки при правке поста освобождает прежнюю."""
+        post = self.create_post('old.gif')
+        old_name = post.image.name
+        client = Client()
+        client.force_login(self.author)
+        client.post(reverse('posts:post_edit', args=(post.pk,)), {
+            'text': 'Новый текст',
+            'image': SimpleUploadedFile('new.png', make_png('red')),
+        })
+        post.refresh_from_db()
+        self.assertNotEqual(post.image.name, old_name)
+        self.assertFalse(post.image.storage.exists(old_name))
+        self.assertFalse(StoredFile.objects.filter(name=old_name).exists())
+
+    def test_missing_file_recreated(self):
+        """Файл, пропавший при живой записи о ссылках, создается заново."""
+        name = self.create_post('0.gif').image.name
+        storage = Post._meta.get_field('image').storage
+        os.remove(storage.path(name))
+        post = self.create_post('1.gif')
+        self.assertEqual(post.image.name, name)
+        self.assertEqual(post.image.read(), SMALL_GIF)
+        self.assertEqual(StoredFile.objects.get(name=name).refs, 2)
+
+    def test_foreign_image_name_ignored(self):
+        """Пост с картинкой вне MEDIA_ROOT удаляется без ошибок."""
+        post = Post.objects.create(
+            text='Пост', author=self.author, image='/tmp/outside.jpg')
+        post.delete()
+        self.assertFalse(Post.objects.exists())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class CollectMediaTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def upload(self, color):
+        content = io.BytesIO()
+        Image.new('RGB', (4, 2), color).save(content, 'PNG')
+        return SimpleUploadedFile(
+            name='image.png',
+            content=content.getvalue(),
+            content_type='image/png',
+        )
+
+    def setUp(self):
+        self.kept = Post.objects.create(
+            text='Пост', author=self.author, image=self.upload('red'))
+        self.replaced = self.kept.image.name
+        thumbnails.generate(self.kept.pk)
+        self.orphans = [thumbnails.ready_thumbnail(self.kept.image, 'card')]
+        self.kept.image = self.upload('green')
+        self.kept.save()
+        thumbnails.generate(self.kept.pk)
+        deleted = Post.objects.create(
+            text='Удаленный пост', author=self.author,
+            image=self.upload('blue'),
+        )
+        thumbnails.generate(deleted.pk)
+        self.orphans.append(thumbnails.ready_thumbnail(deleted.image, 'card'))
+        self.deleted = deleted.image.name
+        Post.objects.filter(pk=deleted.pk).delete()
+        self.stray = default.storage.save(
+            'cache/00/00/stray.jpg', ContentFile(SMALL_GIF))
+        self.storage = self.kept.image.storage
+
+    def tearDown(self):
+        cache.clear()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def collect(self, **options):
+        out = StringIO()
+        options = {'min_age': 0, 'max_rate': 0, **options}
+        call_command('collect_media', stdout=out, **options)
+        return out.getvalue()
+
+    def test_dry_run_keeps_files(self):
+        """Пробный запуск только перечисляет мусор."""
+        out = self.collect(dry_run=True)
+        self.assertIn(f'Would delete {self.replaced}', out)
+        self.assertIn(f'Would delete {self.deleted}', out)
+        self.assertIn(f'Would delete {self.stray}', out)
+        self.assertIn('Would delete 0 images', self.collect(
+            dry_run=True, min_age=3600))
+        for name in (self.replaced, self.deleted):
+            self.assertTrue(self.storage.exists(name))
+        self.assertTrue(default.storage.exists(self.stray))
+
+    def test_unreferenced_media_deleted(self):
+        """Забытые картинки, их миниатюры и чужие файлы удаляются."""
+        self.assertTrue(all(self.orphans))
+        out = self.collect()
+        # Variants of both images stay: TestCase never runs the on_commit
+        # callbacks that release them.
+        self.assertIn(
+            'Deleted 4 images, thumbnails of 2 gone sources, '
+            '3 thumbnails in total.',
+            out,
+        )
+        for name in (self.replaced, self.deleted):
+            self.assertFalse(self.storage.exists(name))
+            self.assertFalse(StoredFile.objects.filter(name=name).exists())
+        for thumbnail in self.orphans:
+            self.assertFalse(thumbnail.exists())
+        self.assertFalse(default.storage.exists(self.stray))
+        self.kept.refresh_from_db()
+        self.assertTrue(self.storage.exists(self.kept.image.name))
+        self.assertTrue(self.kept.image_variants.exists())
+        for variant in self.kept.image_variants.all():
+            self.assertTrue(os.path.exists(variant.image.path))
+        self.assertIsNotNone(
+            thumbnails.ready_thumbnail(self.kept.image, 'card'))
+
+    def test_image_stored_again_kept(self):
+        """Картинку, которую снова загружают, сборщик не удаляет."""
+        path = self.storage.path(self.replaced)
+        old = time.time() - 7200
+        os.utime(path, (old, old))
+        self.storage.save('posts/image.png', self.upload('red'))
+        self.assertFalse(garbage.delete_image(self.replaced, 3600))
+        self.assertTrue(self.storage.exists(self.replaced))
+        self.assertEqual(
+            StoredFile.objects.get(name=self.replaced).refs, 2)
+
+    def test_gone_image_counts_as_collected(self):
+        """Уже удаленная картинка не ломает сборку."""
+        os.remove(self.storage.path(self.deleted))
+        self.assertFalse(garbage.delete_image(self.deleted, 0))
@@ -0,0 +1,85 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import User, Group, Post, Comment, Follow
+
+
+class QueryCountTests(TestCase):
+    """Число запросов страницы не зависит от числа постов на ней."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+        cls.reader = User.objects.create(username='reader')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.group = Group.objects.create(
+            title='Группа',
+            slug='group',
+            description='Для постов',
+        )
+        cls.post = Post.objects.create(
+            text='Пост с комментариями',
+            author=cls.author,
+            group=cls.group,
+            image='posts/post.jpg',
+        )
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def tearDown(self):
+        cache.clear()
+
+    def seed(self, count):
+        """Добавить ``count`` постов и комментариев разных авторов."""
+        for i in range(count):
+            commenter = User.objects.create(
+                username=f'commenter{Comment.objects.count()}')
+            Post.objects.create(
+                text=f'Пост {i}',
+                author=self.author,
+                group=self.group,
+                image=f'posts/{i}.jpg' if i % 2 else '',
+            )
+            Comment.objects.create(
+                text=f'Комментарий {i}',
+                post=self.post,
+                author=commenter,
+            )
+
+    def count_queries(self, url, per_page):
+        cache.clear()
+        with override_settings(POSTS_PER_PAGE=per_page):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.reader_client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_counts_constant(self):
+        """Посты на странице и комментарии не добавляют запросов.
+
+        В обоих замерах у страницы есть следующая, чтобы пагинация
+        делала одни и те же запросы.
+        """
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.author.username,)),
+            reverse('posts:post_detail', args=(self.post.pk,)),
+            reverse('posts:follow_index'),
+        )
+        self.seed(2)
+        few = [self.count_queries(url, 1) for url in urls]
+        self.seed(settings.POSTS_PER_PAGE * 2)
+        many = [
+            self.count_queries(url, settings.POSTS_PER_PAGE) for url in urls
+        ]
+        for url, expected, actual in zip(urls, few, many):
+            with self.subTest(url=url):
+                self.assertEqual(actual, expected)
@@ -0,0 +1,92 @@
+import re
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import User, Group, Post, Comment, Follow
+
+POSTS_TABLES = re.compile(r'"posts_\w+"')
+BAD_PLAN_STEPS = (
+    re.compile(r'USE TEMP B-TREE'),
+    re.compile(r'^SCAN (TABLE )?(?!subquery)\w+$', re.IGNORECASE),
+)
+
+
+class QueryPlanTests(TestCase):
+    """Запросы страниц к таблицам постов идут по индексам без сортировки."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+        cls.reader = User.objects.create(username='reader')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.group = Group.objects.create(
+            title='Группа',
+            slug='group',
+            description='Для постов',
+        )
+        for i in range(25):
+            post = Post.objects.create(
+                text=f'Пост {i}',
+                author=cls.author,
+                group=cls.group,
+            )
+            Comment.objects.create(
+                text=f'Комментарий {i}',
+                post=post,
+                author=cls.reader,
+            )
+        cls.post = post
+
+    def setUp(self):
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def tearDown(self):
+        cache.clear()
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assert_plans_use_indexes(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.reader_client.get(url, params)
+        checked = 0
+        for query in queries:
+            if not query['sql'].startswith('SELECT'):
+                continue
+            if not POSTS_TABLES.search(query['sql']):
+                continue
+            checked += 1
+            for step in self.explain(query['sql']):
+                for bad in BAD_PLAN_STEPS:
+                    with self.subTest(url=url, sql=query['sql'], step=step):
+                        self.assertIsNone(bad.search(step))
+        self.assertGreater(checked, 0)
+        return response
+
+    def test_list_pages_query_plans(self):
+        """Ленты постов читаются по составным индексам."""
+        urls = [
+            reverse('posts:index'),
+            reverse('posts:group_list', args=(self.group.slug,)),
+            reverse('posts:profile', args=(self.author.username,)),
+            reverse('posts:follow_index'),
+        ]
+        for url in urls:
+            response = self.assert_plans_use_indexes(url)
+            cursor = response.context['page_obj'].next_cursor
+            response = self.assert_plans_use_indexes(url, {'after': cursor})
+            cursor = response.context['page_obj'].previous_cursor
+            self.assert_plans_use_indexes(url, {'before': cursor})
+
+    def test_post_detail_query_plans(self):
+        """Комментарии поста читаются по индексу (post, created)."""
+        self.assert_plans_use_indexes(
+            reverse('posts:post_detail', args=(self.post.pk,)))
@@ -0,0 +1,390 @@
+import io
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import (
+    Client, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from core import metrics
+from core.throttling import Throttle
+from posts import thumbnails
+from posts.management.commands.regenerate_thumbnails import Command
+from posts.models import User, Post
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x02\x00'
+    b'\x01\x00\x80\x00\x00\x00\x00\x00'
+    b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+    b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+    b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+    b'\x0A\x00\x3B'
+)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.post = Post.objects.create(
+            text='Пост с картинкой',
+            author=self.author,
+            image=SimpleUploadedFile(
+                name='small.gif',
+                content=SMALL_GIF,
+                content_type='image/gif',
+            ),
+        )
+        self.url = reverse('posts:post_detail', args=(self.post.pk,))
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_original_shown_until_thumbnail_ready(self):
+        """Пока миниатюра не готова, показывается исходная картинка,
+        страница ее не создает.
+        """
+        response = self.client.get(self.url)
+        self.assertContains(response, f'src="{self.post.image.url}"')
+        self.assertIsNone(thumbnails.ready_thumbnail(self.post.image, 'card'))
+
+    def test_generated_thumbnail_shown(self):
+        """После генерации показывается миниатюра, карточка обновляется."""
+        updated = self.post.updated
+        self.assertTrue(thumbnails.generate(self.post.pk))
+        thumbnail = thumbnails.ready_thumbnail(self.post.image, 'card')
+        self.assertEqual((thumbnail.width, thumbnail.height), (960, 339))
+        self.post.refresh_from_db()
+        self.assertGreater(self.post.updated, updated)
+        response = self.client.get(self.url)
+        self.assertContains(response, f'src="{thumbnail.url}"')
+        response = self.client.get(
+            reverse('posts:profile', args=(self.author.username,)))
+        self.assertContains(response, f'src="{thumbnail.url}"')
+
+    def test_page_thumbnails_looked_up_at_once(self):
+        """Миниатюры всех постов страницы ищутся одним запросом."""
+        posts = [self.post] + [
+            Post.objects.create(
+                text=f'Пост {i}',
+                author=self.author,
+                image=SimpleUploadedFile(
+                    name=f'small{i}.gif',
+                    content=SMALL_GIF,
+                    content_type='image/gif',
+                ),
+            )
+            for i in range(3)
+        ]
+        for post in posts:
+            thumbnails.generate(post.pk)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('posts:profile', args=(self.author.username,)))
+        kvstore_queries = [
+            query for query in queries
+            if 'thumbnail_kvstore' in query['sql']
+        ]
+        self.assertEqual(len(kvstore_queries), 1)
+        variant_queries = [
+            query for query in queries
+            if 'posts_postimagevariant' in query['sql']
+        ]
+        self.assertEqual(len(variant_queries), 1)
+        for post in posts:
+            thumbnail = thumbnails.ready_thumbnail(post.image, 'card')
+            self.assertContains(response, f'src="{thumbnail.url}"')
+
+    def test_missing_image_tolerated(self):
+        """Отсутствующий файл картинки не ломает генерацию."""
+        Post.objects.filter(pk=self.post.pk).update(image='posts/none.jpg')
+        failures = metrics.snapshot().get('thumbnail_failures_total', 0)
+        self.assertFalse(thumbnails.generate(self.post.pk))
+        self.assertEqual(
+            metrics.snapshot()['thumbnail_failures_total'], failures + 1)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    @mock.patch('posts.views.thumbnails.schedule')
+    def test_views_schedule_generation(self, schedule):
+        """Создание и смена картинки поста ставят генерацию в очередь."""
+        self.author_client.post(reverse('posts:post_create'), {
+            'text': 'Новый пост',
+            'image': SimpleUploadedFile(
+                name='new.gif',
+                content=SMALL_GIF,
+                content_type='image/gif',
+            ),
+        })
+        self.author_client.post(
+            reverse('posts:post_edit', args=(self.post.pk,)),
+            {'text': 'Новый текст'},
+        )
+        self.assertEqual(schedule.call_count, 1)
+        self.author_client.post(
+            reverse('posts:post_edit', args=(self.post.pk,)),
+            {
+                'text': 'Новый текст',
+                'image': SimpleUploadedFile(
+                    name='other.gif',
+                    content=SMALL_GIF,
+                    content_type='image/gif',
+                ),
+            },
+        )
+        self.assertEqual(schedule.call_count, 2)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, BACKGROUND_WORKERS=2)
+class ThumbnailPoolTests(TransactionTestCase):
+    def tearDown(self):
+        cache.clear()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_generated_in_pool_after_commit(self):
+        """После коммита миниатюры создаются в пуле потоков."""
+        author = User.objects.create(username='author')
+        with transaction.atomic():
+            post = Post.objects.create(
+                text='Пост с картинкой',
+                author=author,
+                image=SimpleUploadedFile(
+                    name='small.gif',
+                    content=SMALL_GIF,
+                    content_type='image/gif',
+                ),
+            )
+            future = thumbnails.schedule(post)
+            self.assertFalse(future.running() or future.done())
+        self.assertTrue(future.result(timeout=30))
+        self.assertIsNotNone(thumbnails.ready_thumbnail(post.image, 'card'))
+        self.assertTrue(post.image_variants.exists())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ImageVariantTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        content = io.BytesIO()
+        Image.new('RGB', (1200, 600), 'red').save(content, 'PNG')
+        self.post = Post.objects.create(
+            text='Пост с большой картинкой',
+            author=self.author,
+            image=SimpleUploadedFile(
+                name='big.png',
+                content=content.getvalue(),
+                content_type='image/png',
+            ),
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_variants_generated(self):
+        """Варианты картинки создаются во всех ширинах и форматах."""
+        thumbnails.generate(self.post.pk)
+        formats = thumbnails.variant_formats()
+        self.assertIn('JPEG', formats)
+        variants = self.post.image_variants.all()
+        self.assertEqual(len(variants), 3 * len(formats))
+        for variant in variants:
+            with self.subTest(variant=variant):
+                with Image.open(variant.image.path) as image:
+                    self.assertEqual(
+                        image.size, (variant.width, variant.height))
+        self.assertEqual(
+            sorted({(variant.width, variant.height) for variant in variants}),
+            [(320, 113), (640, 226), (960, 339)],
+        )
+
+    def test_card_has_srcset(self):
+        """Карточка поста перечисляет варианты картинки в srcset."""
+        thumbnails.generate(self.post.pk)
+        response = self.client.get(
+            reverse('posts:profile', args=(self.author.username,)))
+        self.assertContains(response, '<source type="image/jpeg"')
+        for variant in self.post.image_variants.filter(format='JPEG'):
+            self.assertContains(
+                response, f'{variant.image.url} {variant.width}w')
+
+    def test_new_image_drops_variants(self):
+        """Смена картинки убирает варианты прежней."""
+        thumbnails.generate(self.post.pk)
+        thumbnails.schedule(self.post)
+        self.assertFalse(self.post.image_variants.exists())
+
+    def test_variant_sizes_not_upscaled(self):
+        """Варианты не шире и не выше исходной картинки."""
+        self.assertEqual(thumbnails.variant_sizes(100, 1000), [(100, 35)])
+        self.assertEqual(thumbnails.variant_sizes(2000, 100), [(283, 100)])
+
+    @override_settings(POST_IMAGE_FORMATS=('NOPE', 'JPEG'))
+    def test_unsupported_formats_skipped(self):
+        """Форматы, которые Pillow не умеет записывать, пропускаются."""
+        self.assertEqual(thumbnails.variant_formats(), ['JPEG'])
+
+    def test_size_and_placeholder_stored(self):
+        """Размер и заглушка картинки сохраняются при загрузке."""
+        self.assertEqual(
+            (self.post.image_width, self.post.image_height), (1200, 600))
+        self.assertTrue(
+            self.post.image_placeholder.startswith('data:image/jpeg;base64,'))
+        self.assertLess(len(self.post.image_placeholder), 1024)
+        response = self.client.get(
+            reverse('posts:post_detail', args=(self.post.pk,)))
+        self.assertContains(response, 'width="1200" height="600"')
+        self.assertContains(response, self.post.image_placeholder)
+
+    def test_unreadable_image_left_undescribed(self):
+        """Нечитаемая картинка сохраняется без размера и заглушки."""
+        post = Post.objects.create(
+            text='Пост со сломанной картинкой',
+            author=self.author,
+            image=SimpleUploadedFile(name='broken.png', content=b'nope'),
+        )
+        self.assertIsNone(post.image_width)
+        self.assertEqual(post.image_placeholder, '')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class RegenerateThumbnailsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.posts = []
+        for i in range(3):
+            content = io.BytesIO()
+            Image.new('RGB', (4, 2), (i, 0, 0)).save(content, 'PNG')
+            self.posts.append(Post.objects.create(
+                text=f'Пост {i}',
+                author=self.author,
+                image=SimpleUploadedFile(
+                    name=f'small{i}.png',
+                    content=content.getvalue(),
+                    content_type='image/png',
+                ),
+            ))
+        self.checkpoint = os.path.join(TEMP_MEDIA_ROOT, 'checkpoint')
+
+    def tearDown(self):
+        cache.clear()
+
+    def regenerate(self, **options):
+        out = io.StringIO()
+        call_command(
+            'regenerate_thumbnails',
+            chunk_size=2,
+            max_rate=0,
+            checkpoint=self.checkpoint,
+            stdout=out,
+            **{'processes': 1, **options},
+        )
+        return out.getvalue()
+
+    def test_all_posts_regenerated(self):
+        """Команда заново создает миниатюры и варианты всех постов."""
+        thumbnails.generate(self.posts[0].pk)
+        old_variants = set(
+            self.posts[0].image_variants.values_list('pk', flat=True))
+        out = self.regenerate()
+        self.assertIn('Regenerated 2/3 posts, 0 failed', out)
+        self.assertIn('Done: 3 posts, 0 failed.', out)
+        for post in self.posts:
+            self.assertIsNotNone(
+                thumbnails.ready_thumbnail(post.image, 'card'))
+        self.assertFalse(old_variants & set(
+            self.posts[0].image_variants.values_list('pk', flat=True)))
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_processes_on_sqlite(self):
+        """На SQLite несколько процессов заменяются одним без ложных
+        ошибок блокировки базы.
+        """
+        err = io.StringIO()
+        out = self.regenerate(processes=2, stderr=err)
+        self.assertIn('regenerating in a single process', err.getvalue())
+        self.assertIn('Done: 3 posts, 0 failed.', out)
+
+    def test_chunks_throttled_before_pool(self):
+        """Пулу передаются уже прочитанные и ограниченные порции."""
+        chunks = []
+
+        def imap(function, pks):
+            chunks.append(pks)
+            return map(function, pks)
+
+        Command(stdout=io.StringIO()).regenerate(
+            Post.objects.exclude(image=''), 2, self.checkpoint,
+            Throttle(0), imap,
+        )
+        os.remove(self.checkpoint)
+        self.assertEqual(
+            chunks,
+            [[post.pk for post in self.posts[:2]], [self.posts[2].pk]],
+        )
+
+    def test_resumes_after_checkpoint(self):
+        """Прерванная обработка продолжается после последней порции."""
+        with open(self.checkpoint, 'w') as file:
+            file.write(str(self.posts[1].pk))
+        out = self.regenerate()
+        self.assertIn(f'Resuming after post {self.posts[1].pk}.', out)
+        self.assertIn('Done: 1 posts', out)
+        self.assertIsNone(
+            thumbnails.ready_thumbnail(self.posts[0].image, 'card'))
+        self.assertIsNotNone(
+            thumbnails.ready_thumbnail(self.posts[2].image, 'card'))
+
+    def test_restart_ignores_checkpoint(self):
+        """С --restart обработка начинается с первого поста."""
+        with open(self.checkpoint, 'w') as file:
+            file.write(str(self.posts[1].pk))
+        self.assertIn('Done: 3 posts', self.regenerate(restart=True))
+
+    @mock.patch('posts.management.commands.regenerate_thumbnails.Throttle')
+    def test_source_bytes_throttled(self, throttle):
+        """Скорость ограничивается по объему прочитанных картинок."""
+        self.regenerate()
+        throttle.assert_called_once_with(0)
+        consume = throttle.return_value.consume
+        self.assertEqual(consume.call_count, 3)
+        consume.assert_called_with(self.posts[-1].image.size)
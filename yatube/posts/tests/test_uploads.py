@@ -0,0 +1,152 @@
+import io
+import os
+import struct
+import subprocess
+import sys
+import tempfile
+import zlib
+from unittest import skipUnless
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, override_settings
+from PIL import Image
+
+from posts.forms import PostForm
+from posts.uploads import bound_image
+
+CLEAR_REFS = '/proc/self/clear_refs'
+PEAK_MEMORY_SCRIPT = '''
+import sys
+
+import django
+
+django.setup()
+
+from django.core.files import File
+from PIL import Image
+
+from posts.uploads import bound_image
+
+
+def status(name):
+    with open('/proc/self/status') as lines:
+        for line in lines:
+            if line.startswith(name + ':'):
+                return int(line.split()[1])
+
+
+with open('/proc/self/clear_refs', 'w') as clear_refs:
+    clear_refs.write('5')
+before = status('VmRSS')
+with open(sys.argv[2], 'rb') as upload:
+    if sys.argv[1] == 'bounded':
+        bound_image(File(upload, name='big.jpg'))
+    else:
+        Image.open(upload).load()
+print(status('VmHWM') - before)
+'''
+
+
+def make_image(size, format_, mode='RGB'):
+    content = io.BytesIO()
+    Image.new(mode, size, 'white').save(content, format_)
+    return content.getvalue()
+
+
+def png_header(width, height):
+    """PNG without pixel data that declares the given size."""
+    def chunk(name, data):
+        return (
+            struct.pack('>I', len(data)) + name + data
+            + struct.pack('>I', zlib.crc32(name + data))
+        )
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+        + chunk(b'IEND', b'')
+    )
+
+
+class BoundImageTests(SimpleTestCase):
+    def clean(self, content, name='image.jpg'):
+        return bound_image(SimpleUploadedFile(name, content, 'image/jpeg'))
+
+    def test_small_image_stored_untouched(self):
+        """Небольшая картинка сохраняется без перекодирования."""
+        content = make_image((300, 200), 'PNG')
+        upload = self.clean(content, 'image.png')
+        self.assertEqual(upload.read(), content)
+        self.assertEqual(upload.content_type, 'image/png')
+
+    def test_large_image_downscaled(self):
+        """Картинка больше POST_IMAGE_STORED_SIZE уменьшается."""
+        upload = self.clean(make_image((4000, 3000), 'JPEG'))
+        self.assertEqual(upload.name, 'image.jpg')
+        with Image.open(upload) as image:
+            self.assertEqual(image.size, (2048, 1536))
+
+    def test_post_form_downscales_upload(self):
+        """Форма поста сохраняет уменьшенную картинку."""
+        form = PostForm({'text': 'Текст'}, {
+            'image': SimpleUploadedFile(
+                'big.jpg', make_image((3000, 3000), 'JPEG'), 'image/jpeg'),
+        })
+        self.assertTrue(form.is_valid())
+        with Image.open(form.cleaned_data['image']) as image:
+            self.assertEqual(image.size, (2048, 2048))
+
+    def test_header_limits(self):
+        """Размеры проверяются по заголовку, без декодирования."""
+        for width, height in ((100000, 100000), (20000, 1), (13000, 12000)):
+            with self.subTest(width=width, height=height):
+                with self.assertRaisesMessage(
+                    ValidationError, 'слишком большая',
+                ):
+                    self.clean(png_header(width, height), 'image.png')
+
+    def test_broken_image_rejected(self):
+        """Файл, не являющийся картинкой, отклоняется."""
+        with self.assertRaisesMessage(
+            ValidationError, 'не является картинкой',
+        ):
+            self.clean(b'not an image')
+
+    @override_settings(
+        POST_IMAGE_STORED_SIZE=1000,
+        POST_IMAGE_MAX_DECODED_PIXELS=4 * 1000 * 1000,
+    )
+    def test_decoded_size_limit(self):
+        """JPEG декодируется в уменьшенном масштабе,
+        остальные форматы ограничены POST_IMAGE_MAX_DECODED_PIXELS.
+        """
+        upload = self.clean(make_image((3000, 3000), 'JPEG'))
+        with Image.open(upload) as image:
+            self.assertEqual(image.size, (1000, 1000))
+        with self.assertRaisesMessage(ValidationError, 'слишком большая'):
+            self.clean(make_image((3000, 3000), 'PNG', 'L'), 'image.png')
+
+    @skipUnless(os.path.exists(CLEAR_REFS), 'нужен /proc/self/clear_refs')
+    def test_peak_memory(self):
+        """Пиковая память на загрузку ограничена размером хранимой
+        картинки, а не исходной.
+        """
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as upload:
+            upload.write(make_image((6000, 4000), 'JPEG'))
+            upload.flush()
+            peaks = {}
+            for mode in ('bounded', 'full'):
+                result = subprocess.run(
+                    [sys.executable, '-c', PEAK_MEMORY_SCRIPT,
+                     mode, upload.name],
+                    cwd=settings.BASE_DIR,
+                    env=dict(
+                        os.environ, DJANGO_SETTINGS_MODULE='yatube.settings'),
+                    stdout=subprocess.PIPE,
+                    check=True,
+                )
+                peaks[mode] = int(result.stdout)
+        stored_frames_kb = 4 * settings.POST_IMAGE_STORED_SIZE ** 2 * 4 // 1024
+        self.assertGreater(peaks['full'], stored_frames_kb)
+        self.assertLess(peaks['bounded'], stored_frames_kb)
@@ -6,9 +6,14 @@ from django import forms
 from django.conf import settings
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase, Client
+from django.db import connection
+from django.test import TestCase, Client, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from core import metrics
+from core.utils import COUNT_VERSION_KEY, count_version
+from posts.cards import touch_posts
 from posts.models import User, Group, Post, Follow
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -85,6 +90,24 @@ class PostViewTests(TestCase):
         response3 = self.client.get(reverse('posts:index'))
         self.assertNotEqual(response2.content, response3.content)
 
+    def test_index_page_cache_shared_by_users(self):
+        """Кэш главной страницы общий для всех пользователей,
+        а шапка отрисовывается для каждого пользователя.
+        """
+        hits = metrics.labelled('cache_hits_total', cache='index_page')
+        hits_before = metrics.snapshot().get(hits, 0)
+        self.auth_client.get(reverse('posts:index'))
+        Post.objects.create(text='Пост после кэширования', author=self.user)
+        response = self.follower_client.get(reverse('posts:index'))
+        self.assertNotContains(response, 'Пост после кэширования')
+        self.assertContains(response, 'Пользователь: follower')
+        self.assertContains(response, 'Избранные авторы')
+        self.assertNotContains(response, 'Пользователь: user')
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Войти')
+        self.assertNotContains(response, 'Избранные авторы')
+        self.assertEqual(metrics.snapshot()[hits], hits_before + 2)
+
     def test_pages_uses_correct_templates(self):
         """URL адреса используют соответствующий шаблон."""
         pages_template_names = {
@@ -285,6 +308,16 @@ class PaginatorViewTest(TestCase):
     def setUp(self):
         self.follower_client = Client()
         self.follower_client.force_login(self.follower)
+        self.url_clients = {
+            reverse('posts:index'): self.client,
+            reverse('posts:group_list', args=(self.group.slug,)): self.client,
+            reverse('posts:profile',
+                    args=(self.author.username,)): self.client,
+            reverse('posts:follow_index'): self.follower_client,
+        }
+
+    def tearDown(self):
+        cache.clear()
 
     def test_list_pages_check_records_count(self):
         """Кол-во постов в пагинации на каждой из страниц со списками."""
@@ -312,3 +345,119 @@ class PaginatorViewTest(TestCase):
                         len(response.context['page_obj']),
                         posts_count_on_page,
                     )
+
+    def test_list_pages_walk_cursors(self):
+        """Курсоры next/previous обходят все посты без повторов."""
+        expected = list(
+            Post.objects.order_by('-created', '-pk').values_list(
+                'pk', flat=True)
+        )
+        for url, client in self.url_clients.items():
+            with self.subTest(value=url):
+                seen = []
+                params = {}
+                while True:
+                    page_obj = client.get(url, params).context['page_obj']
+                    seen.extend(post.pk for post in page_obj)
+                    if not page_obj.has_next():
+                        break
+                    params = {'after': page_obj.next_cursor}
+                self.assertEqual(seen, expected)
+                response = client.get(
+                    url, {'before': page_obj.previous_cursor})
+                self.assertEqual(
+                    [post.pk for post in response.context['page_obj']],
+                    expected[:settings.POSTS_PER_PAGE],
+                )
+                self.assertFalse(response.context['page_obj'].has_previous())
+
+    def test_list_pages_do_not_count(self):
+        """Страницы со списками берут число постов из кэша
+        и не выполняют OFFSET.
+        """
+        for url, client in self.url_clients.items():
+            with self.subTest(value=url):
+                page_obj = client.get(url).context['page_obj']
+                with CaptureQueriesContext(connection) as queries:
+                    client.get(url, {'after': page_obj.next_cursor})
+                for query in queries:
+                    self.assertNotIn('COUNT(', query['sql'])
+                    self.assertNotIn('OFFSET', query['sql'])
+
+    def test_cached_count_invalidated_by_new_post(self):
+        """Кэшированное число постов сбрасывается при создании поста."""
+        url = reverse('posts:group_list', args=(self.group.slug,))
+        paginator = self.client.get(url).context['page_obj'].paginator
+        self.assertEqual(paginator.count, self.posts_count_for_test)
+        Post.objects.create(text='Еще пост', group=self.group,
+                            author=self.author)
+        paginator = self.client.get(url).context['page_obj'].paginator
+        self.assertEqual(paginator.count, self.posts_count_for_test + 1)
+
+    def test_cached_count_kept_on_edit(self):
+        """Правка поста не сбрасывает кэшированные числа постов."""
+        version = count_version()
+        post = Post.objects.filter(group=self.group).first()
+        post.text = 'Исправленный текст'
+        post.save()
+        touch_posts(pk=post.pk)
+        self.assertEqual(count_version(), version)
+        post.delete()
+        self.assertEqual(count_version(), version + 1)
+
+    def test_cached_count_invalidated_by_group_change(self):
+        """Перенос поста в другую группу сбрасывает кэшированные числа."""
+        version = count_version()
+        post = Post.objects.filter(group=self.group).first()
+        post.group = None
+        post.save()
+        self.assertEqual(count_version(), version + 1)
+        post.save()
+        self.assertEqual(count_version(), version + 1)
+
+    def test_stale_count_recounted_past_the_end(self):
+        """Номер за последней страницей при устаревшем числе постов
+        пересчитывает его один раз и отдает настоящую последнюю страницу.
+        """
+        url = reverse('posts:group_list', args=(self.group.slug,))
+        self.client.get(url)
+        Post.objects.filter(
+            pk__in=Post.objects.filter(group=self.group).values('pk')[:5],
+        ).update(group=None)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, {'page': 2})
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.number, 1)
+        self.assertEqual(page_obj.paginator.count, 8)
+        self.assertEqual(
+            sum('COUNT(' in query['sql'] for query in queries), 1)
+        paginator = self.client.get(url).context['page_obj'].paginator
+        self.assertEqual(paginator.count, 8)
+
+    def test_evicted_count_version_not_reused(self):
+        """Потерянная версия не начинается заново с единицы."""
+        cache.delete(COUNT_VERSION_KEY)
+        self.assertGreater(count_version(), 1)
+
+    @override_settings(PAGINATOR_EXACT_COUNT_LIMIT=5)
+    def test_large_count_is_approximate(self):
+        """Число постов выше порога считается приблизительно."""
+        response = self.client.get(reverse('posts:index'))
+        paginator = response.context['page_obj'].paginator
+        self.assertEqual(paginator.count, 5)
+        self.assertFalse(paginator.count_is_exact)
+        self.assertContains(response, 'из 1+')
+
+    def test_list_pages_invalid_page_falls_back(self):
+        """Некорректный номер или курсор отдает первую страницу,
+        слишком большой номер - последнюю.
+        """
+        url = reverse('posts:group_list', args=(self.group.slug,))
+        for params, number in (
+            ({'page': 'abc'}, 1),
+            ({'after': 'broken'}, 1),
+            ({'page': 100}, 2),
+        ):
+            with self.subTest(value=params):
+                response = self.client.get(url, params)
+                self.assertEqual(response.context['page_obj'].number, number)
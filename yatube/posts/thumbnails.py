@@ -0,0 +1,274 @@
+"""Thumbnails of post images, generated off the request path.
+
+Every geometry of ``POST_THUMBNAILS`` is created by ``core.background``
+once the transaction that saved the post commits. Until then templates
+show the original image: ``ready_thumbnail`` only looks thumbnails up in
+sorl's key-value store and never creates them. ``prefetch_thumbnails``
+looks up the thumbnails of a whole page of posts at once.
+
+Along with them the card crop is saved in ``POST_IMAGE_WIDTHS`` widths
+and every ``POST_IMAGE_FORMATS`` format Pillow can write, as
+``PostImageVariant`` rows for ``srcset`` of the card ``<picture>``.
+"""
+import io
+import logging
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+from sorl.thumbnail import base, default, delete
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from core import background, metrics
+from posts import cards
+from posts.models import Post, PostImageVariant
+
+logger = logging.getLogger(__name__)
+
+VARIANT_THUMBNAIL = 'card'
+MIME_TYPES = {
+    'AVIF': 'image/avif',
+    'WEBP': 'image/webp',
+    'JPEG': 'image/jpeg',
+}
+EXTENSIONS = {
+    'AVIF': 'avif',
+    'WEBP': 'webp',
+    'JPEG': 'jpg',
+}
+
+
+class ThumbnailBackend(base.ThumbnailBackend):
+    """sorl backend that can find thumbnails without creating them."""
+
+    def get_thumbnail_file(self, file_, geometry_string, **options):
+        """The file ``get_thumbnail`` would return, possibly not created."""
+        source = ImageFile(file_)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+    def get_ready_thumbnail(self, file_, geometry_string, **options):
+        """The stored thumbnail ``get_thumbnail`` would return, or None."""
+        return default.kvstore.get(
+            self.get_thumbnail_file(file_, geometry_string, **options))
+
+
+class KVStore(cached_db_kvstore.KVStore):
+    """sorl key-value store that can look many images up at once."""
+
+    def get_many(self, image_files):
+        """Stored ``image_files`` in the same order, None if missing.
+
+        Costs one cache ``get_many`` and a query for the cache misses.
+        """
+        keys = [add_prefix(image_file.key) for image_file in image_files]
+        values = self.cache.get_many(keys)
+        missing = [key for key in keys if key not in values]
+        if missing:
+            found = dict(
+                KVStoreModel.objects.filter(
+                    key__in=missing,
+                ).values_list('key', 'value')
+            )
+            found.update(
+                (key, cached_db_kvstore.EMPTY_VALUE)
+                for key in missing if key not in found
+            )
+            self.cache.set_many(
+                found, thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT)
+            values.update(found)
+        return [
+            None if values[key] == cached_db_kvstore.EMPTY_VALUE
+            else deserialize_image_file(values[key])
+            for key in keys
+        ]
+
+
+backend = ThumbnailBackend()
+
+
+def ready_thumbnail(image, name):
+    """Thumbnail ``name`` of ``POST_THUMBNAILS`` if it is generated."""
+    if not image:
+        return None
+    geometry, options = settings.POST_THUMBNAILS[name]
+    return backend.get_ready_thumbnail(image, geometry, **options)
+
+
+def prefetch_thumbnails(posts, name):
+    """Look the thumbnail ``name`` of all ``posts`` up in one batch.
+
+    The results are kept in ``post.prefetched_thumbnails`` for
+    ``post_thumbnail``.
+    """
+    geometry, options = settings.POST_THUMBNAILS[name]
+    posts = [post for post in posts if post.image]
+    found = default.kvstore.get_many([
+        backend.get_thumbnail_file(post.image, geometry, **options)
+        for post in posts
+    ])
+    for post, thumbnail in zip(posts, found):
+        if not hasattr(post, 'prefetched_thumbnails'):
+            post.prefetched_thumbnails = {}
+        post.prefetched_thumbnails[name] = thumbnail
+
+
+def post_thumbnail(post, name):
+    """Thumbnail ``name`` of the post image, prefetched if possible."""
+    prefetched = getattr(post, 'prefetched_thumbnails', {})
+    if name in prefetched:
+        return prefetched[name]
+    return ready_thumbnail(post.image, name)
+
+
+def variant_formats():
+    """Formats of ``POST_IMAGE_FORMATS`` this Pillow build can write."""
+    Image.init()
+    return [
+        format_ for format_ in settings.POST_IMAGE_FORMATS
+        if format_ in Image.SAVE
+    ]
+
+
+def variant_sizes(width, height):
+    """Sizes of the card crops of a ``width`` x ``height`` image.
+
+    The crops keep the card aspect ratio and are never upscaled.
+    """
+    geometry, _ = settings.POST_THUMBNAILS[VARIANT_THUMBNAIL]
+    card_width, card_height = map(int, geometry.split('x'))
+    largest = min(width, height * card_width // card_height)
+    widths = sorted({
+        min(variant_width, largest)
+        for variant_width in settings.POST_IMAGE_WIDTHS
+    })
+    ratio = card_height / card_width
+    return [
+        (variant_width, max(1, round(variant_width * ratio)))
+        for variant_width in widths if variant_width
+    ]
+
+
+def delete_variants(post):
+    """Remove the image variants of the post.
+
+    Their files are released by ``posts.signals.release_image``.
+    """
+    post.image_variants.all().delete()
+
+
+def generate_variants(post):
+    """Replace the image variants of the post with fresh ones.
+
+    Each crop is resized from the next larger one, so the source image
+    is decoded once.
+    """
+    delete_variants(post)
+    formats = variant_formats()
+    stem = os.path.splitext(os.path.basename(post.image.name))[0]
+    variants = []
+    with post.image.open() as file, Image.open(file) as image:
+        image = image.convert('RGB')
+        for width, height in reversed(variant_sizes(*image.size)):
+            image = ImageOps.fit(image, (width, height), Image.LANCZOS)
+            for format_ in formats:
+                content = io.BytesIO()
+                image.save(
+                    content, format_, quality=settings.POST_IMAGE_QUALITY)
+                variant = PostImageVariant(
+                    post=post, format=format_, width=width, height=height)
+                variant.image.save(
+                    f'{stem}_{width}.{EXTENSIONS[format_]}',
+                    ContentFile(content.getvalue()),
+                    save=False,
+                )
+                variants.append(variant)
+    return PostImageVariant.objects.bulk_create(variants)
+
+
+def picture_sources(post):
+    """``<source>`` attributes of the post image, best format first."""
+    srcsets = {}
+    variants = sorted(
+        post.image_variants.all(), key=lambda variant: variant.width)
+    for variant in variants:
+        srcsets.setdefault(variant.format, []).append(
+            f'{variant.image.url} {variant.width}w')
+    return [
+        {'type': MIME_TYPES[format_], 'srcset': ', '.join(srcsets[format_])}
+        for format_ in settings.POST_IMAGE_FORMATS if format_ in srcsets
+    ]
+
+
+def generate(post_id):
+    """Create all thumbnails and variants of the post image.
+
+    Return whether the thumbnails exist.
+
+    A missing or broken source file is logged and counted, the post is
+    left showing its original image.
+    """
+    post = Post.objects.filter(pk=post_id).first()
+    if post is None or not post.image:
+        return False
+    try:
+        with metrics.timer('thumbnail_seconds_total'):
+            for geometry, options in settings.POST_THUMBNAILS.values():
+                backend.get_thumbnail(post.image, geometry, **options)
+            generate_variants(post)
+    except Exception:
+        logger.exception('Cannot create thumbnails of post %s', post_id)
+        ready = False
+    else:
+        ready = all(
+            ready_thumbnail(post.image, name)
+            for name in settings.POST_THUMBNAILS
+        )
+    if not ready:
+        metrics.incr('thumbnail_failures_total')
+        return False
+    metrics.incr('thumbnail_posts_total')
+    cards.touch_posts(pk=post_id)
+    return True
+
+
+def regenerate(post_id):
+    """Drop the stored thumbnails of the post image and generate anew.
+
+    Unlike ``generate`` this also replaces thumbnails whose geometry
+    did not change, so new settings reach every post.
+    """
+    post = Post.objects.filter(pk=post_id).only('image').first()
+    if post is not None and post.image:
+        try:
+            delete(post.image, delete_file=False)
+        except Exception:
+            logger.exception('Cannot delete thumbnails of post %s', post_id)
+    return generate(post_id)
+
+
+def schedule(post):
+    """Generate the post thumbnails in the background after the commit.
+
+    Variants of the previous image are removed right away. Return a
+    ``Future`` of the ``generate`` result, or None for a post without an
+    image.
+    """
+    delete_variants(post)
+    if not post.image:
+        return None
+    return background.after_commit(generate, post.pk)
@@ -0,0 +1,109 @@
+"""Ingest of uploaded post images with bounded memory.
+
+Only the image header is read to check the ``POST_IMAGE_MAX_SIDE`` and
+``POST_IMAGE_MAX_PIXELS`` limits. Images larger than
+``POST_IMAGE_STORED_SIZE`` are decoded at a reduced scale where the
+format allows it (JPEG draft mode), shrunk and re-encoded into a
+spooled temporary file; smaller images are stored untouched.
+
+``describe_image`` computes the intrinsic size of an image and a tiny
+blurred placeholder to show while the image loads.
+"""
+import base64
+import io
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
+from PIL import Image
+
+TOO_LARGE = 'Картинка слишком большая.'
+INVALID_IMAGE = 'Файл поврежден или не является картинкой.'
+PLACEHOLDER_QUALITY = 40
+
+
+def _too_large():
+    raise ValidationError(TOO_LARGE, code='too_large')
+
+
+def _invalid_image(exc):
+    raise ValidationError(INVALID_IMAGE, code='invalid_image') from exc
+
+
+def bound_image(upload):
+    """The upload checked and downscaled to ``POST_IMAGE_STORED_SIZE``."""
+    upload.seek(0)
+    try:
+        image = Image.open(upload)
+    except Image.DecompressionBombError:
+        _too_large()
+    except Exception as exc:
+        _invalid_image(exc)
+    width, height = image.size
+    if (
+        max(width, height) > settings.POST_IMAGE_MAX_SIDE
+        or width * height > settings.POST_IMAGE_MAX_PIXELS
+    ):
+        _too_large()
+    upload.content_type = Image.MIME.get(image.format)
+    if max(width, height) > settings.POST_IMAGE_STORED_SIZE:
+        return downscale(upload, image)
+    upload.seek(0)
+    return upload
+
+
+def downscale(upload, image):
+    """Shrink the opened upload image to ``POST_IMAGE_STORED_SIZE``."""
+    size = (settings.POST_IMAGE_STORED_SIZE,) * 2
+    source_format = image.format
+    format_ = source_format if source_format in Image.SAVE else 'JPEG'
+    scale = settings.POST_IMAGE_STORED_SIZE / max(image.size)
+    image.draft(None, tuple(round(side * scale) for side in image.size))
+    if image.width * image.height > settings.POST_IMAGE_MAX_DECODED_PIXELS:
+        _too_large()
+    try:
+        image.thumbnail(size, Image.LANCZOS)
+    except Exception as exc:
+        _invalid_image(exc)
+    if format_ == 'JPEG' and image.mode not in ('RGB', 'L', 'CMYK'):
+        image = image.convert('RGB')
+    content = tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    image.save(content, format_, quality=settings.POST_IMAGE_STORED_QUALITY)
+    content.seek(0)
+    name = upload.name
+    if format_ != source_format:
+        name = os.path.splitext(name)[0] + '.jpg'
+    resized = File(content, name=name)
+    resized.content_type = Image.MIME[format_]
+    return resized
+
+
+def describe_image(file):
+    """``(width, height, placeholder)`` of an image file.
+
+    The placeholder is a JPEG data URI at most
+    ``POST_IMAGE_PLACEHOLDER_SIZE`` pixels wide, decoded at the smallest
+    draft scale; it is empty for images too large to decode.
+    """
+    file.seek(0)
+    with Image.open(file) as image:
+        width, height = image.size
+        side = settings.POST_IMAGE_PLACEHOLDER_SIZE
+        image.draft('RGB', (side, side))
+        if (
+            image.width * image.height
+            > settings.POST_IMAGE_MAX_DECODED_PIXELS
+        ):
+            placeholder = ''
+        else:
+            image.thumbnail((side, side))
+            content = io.BytesIO()
+            image.convert('RGB').save(
+                content, 'JPEG', quality=PLACEHOLDER_QUALITY)
+            placeholder = 'data:image/jpeg;base64,' + base64.b64encode(
+                content.getvalue()).decode()
+    file.seek(0)
+    return width, height, placeholder
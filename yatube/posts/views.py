@@ -1,15 +1,18 @@
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.vary import vary_on_cookie
-from django.views.decorators.cache import cache_page
+from django.db import transaction
 from django.shortcuts import get_object_or_404, redirect, render
 
+from core import metrics
+from core.caching import cache_page_shared
+from core.storage import release_on_commit
 from core.utils import get_page_obj
+from posts import thumbnails
+from posts.feeds import FEED_KEYS, get_feed
 from posts.forms import PostForm, CommentForm
 from posts.models import User, Group, Post, Follow
 
 
-@cache_page(20, key_prefix='index_page')
-@vary_on_cookie
+@cache_page_shared(20, key_prefix='index_page')
 def index(request):
     page_obj = get_page_obj(
         request,
@@ -23,7 +26,10 @@ def index(request):
 
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    page_obj = get_page_obj(request, group.posts.all())
+    page_obj = get_page_obj(
+        request,
+        group.posts.select_related('author', 'group'),
+    )
 
     return render(request, 'posts/group_list.html', {
         'group': group,
@@ -32,8 +38,14 @@ def group_posts(request, slug):
 
 
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    page_obj = get_page_obj(request, author.posts.all())
+    author = get_object_or_404(
+        User.objects.select_related('stats'),
+        username=username,
+    )
+    page_obj = get_page_obj(
+        request,
+        author.posts.select_related('author', 'group'),
+    )
     return render(request, 'posts/profile.html', {
         'author': author,
         'page_obj': page_obj,
@@ -45,16 +57,20 @@ def profile(request, username):
 
 
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__stats', 'group'),
+        pk=post_id,
+    )
 
     return render(request, 'posts/post_detail.html', {
         'post': post,
         'form': CommentForm(),
-        'comments': post.comments.all(),
+        'comments': post.comments.select_related('author'),
     })
 
 
 @login_required
+@transaction.atomic
 def post_create(request):
     form = PostForm(
         request.POST or None,
@@ -64,6 +80,7 @@ def post_create(request):
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        thumbnails.schedule(post)
         return redirect('posts:profile', username=request.user)
 
     return render(request, 'posts/create_post.html', {
@@ -72,11 +89,14 @@ def post_create(request):
 
 
 @login_required
+@transaction.atomic
 def post_edit(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     if post.author != request.user:
         return redirect('posts:post_detail', post_id=post_id)
 
+    # Validation already puts the new image on the post.
+    old_image = post.image
     form = PostForm(
         request.POST or None,
         files=request.FILES or None,
@@ -84,6 +104,10 @@ def post_edit(request, post_id):
     )
     if form.is_valid():
         form.save()
+        if 'image' in form.changed_data:
+            if old_image:
+                release_on_commit(old_image)
+            thumbnails.schedule(post)
         return redirect('posts:post_detail', post_id=post_id)
 
     return render(request, 'posts/create_post.html', {
@@ -93,6 +117,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     post = get_object_or_404(Post, pk=post_id)
     form = CommentForm(request.POST or None)
@@ -106,11 +131,8 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    followings = request.user.follower.values('author_id')
-    page_obj = get_page_obj(
-        request,
-        Post.objects.filter(author__in=followings)
-    )
+    with metrics.timer('feed_read_seconds_total'):
+        page_obj = get_page_obj(request, get_feed(request.user), FEED_KEYS)
 
     return render(request, 'posts/index.html', {
         'page_obj': page_obj,
@@ -118,6 +140,7 @@ def follow_index(request):
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if author != request.user:
@@ -131,6 +154,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     params = {
@@ -53,7 +53,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -68,7 +70,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.backends.templates.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -83,6 +85,16 @@ TEMPLATES = [
     },
 ]
 
+if not DEBUG:
+    # Templates are compiled once per process, by core.warmup at start.
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
 
@@ -99,10 +111,27 @@ DATABASES = {
 
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'BACKEND': 'core.backends.sqlite.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'default.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+            'MAX_SIZE': 64 * 1024 * 1024,
+        },
     }
 }
 
+# Stampede protection of core.caching.get_many_or_set.
+CACHE_STALE_TIMEOUT = 60
+CACHE_LOCK_TIMEOUT = 10
+CACHE_LOCK_WAIT = 2
+CACHE_EARLY_REFRESH_BETA = 1.0
+
+if DEBUG:
+    # The development server is a single process.
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -148,6 +177,15 @@ STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# None to stream files from Python, 'x-sendfile' or 'x-accel-redirect'
+# to hand them to the front server.
+MEDIA_SENDFILE = None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+MEDIA_CACHE_MAX_AGE = 60 * 60 * 24
+# Defaults of the collect_media command: files younger than the age in
+# seconds are kept, deletes per second are limited.
+MEDIA_GC_MIN_AGE = 60 * 60
+MEDIA_GC_RATE = 50
 
 
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
@@ -162,4 +200,52 @@ LOGIN_REDIRECT_URL = 'posts:index'
 # LOGOUT_REDIRECT_URL = 'posts:index'
 
 
+# core.metrics: with a directory every process writes its values there
+# and /metrics/ adds them up. The development server is one process.
+# Scrapers authenticate with "Authorization: Bearer <METRICS_TOKEN>".
+METRICS_DIR = None if DEBUG else os.path.join(BASE_DIR, 'cache', 'metrics')
+METRICS_FLUSH_INTERVAL = 1
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+# Time of every template and include in core.metrics, see core.profiling.
+TEMPLATE_PROFILING = False
+
+# SQL queries allowed per request by URL name, checked by
+# core.middleware.QueryBudgetMiddleware. Overruns are logged, or raise
+# with QUERY_BUDGET_RAISE.
+QUERY_BUDGETS = {
+    'posts:index': 10,
+    'posts:group_list': 10,
+    'posts:profile': 12,
+    'posts:post_detail': 10,
+    'posts:follow_index': 10,
+}
+QUERY_BUDGET_RAISE = DEBUG
+
 POSTS_PER_PAGE = 10
+PAGINATOR_EXACT_COUNT_LIMIT = 10000
+PAGINATOR_COUNT_TIMEOUT = 60 * 60
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+FEED_MAX_LENGTH = 1000
+FEED_PUSH_FOLLOWER_LIMIT = 5000
+
+POST_THUMBNAILS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+POST_IMAGE_MAX_SIDE = 16384
+POST_IMAGE_MAX_PIXELS = 150 * 1000 * 1000
+POST_IMAGE_MAX_DECODED_PIXELS = 16 * 1000 * 1000
+POST_IMAGE_STORED_SIZE = 2048
+POST_IMAGE_STORED_QUALITY = 90
+POST_IMAGE_PLACEHOLDER_SIZE = 16
+POST_IMAGE_WIDTHS = (320, 640, 960)
+POST_IMAGE_FORMATS = ('AVIF', 'WEBP', 'JPEG')
+POST_IMAGE_QUALITY = 80
+# core.background runs jobs such as thumbnails in a thread pool of this
+# size after the commit, or in the committing thread with 0.
+BACKGROUND_WORKERS = 2
+THUMBNAIL_KVSTORE = 'posts.thumbnails.KVStore'
+# Defaults of the regenerate_thumbnails command.
+THUMBNAIL_REGENERATE_RATE = 8 * 1024 * 1024
+THUMBNAIL_REGENERATE_CHECKPOINT = os.path.join(
+    BASE_DIR, 'cache', 'regenerate_thumbnails.checkpoint')
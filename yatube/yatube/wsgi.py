@@ -2,6 +2,8 @@
 WSGI config for yatube project.
 
 It exposes the WSGI callable as a module-level variable named ``application``.
+The process is warmed up by ``core.warmup`` before it serves requests,
+unless ``YATUBE_WARMUP=0`` is set.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/2.2/howto/deployment/wsgi/
@@ -14,3 +16,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
 
 application = get_wsgi_application()
+
+if os.environ.get('YATUBE_WARMUP', '1') != '0':
+    from core.warmup import warm_up
+    warm_up()